@@ -5,8 +5,20 @@ This package provides tools for automating Android and iOS phone interactions
 using AI models for visual understanding and decision making.
 """
 
-from phone_agent.agent import PhoneAgent
-from phone_agent.agent_ios import IOSPhoneAgent
+from phone_agent._lazy import lazy_attributes
 
 __version__ = "0.1.0"
+
+# The agents pull in every device backend, the prompts and the app tables, so
+# they are imported on first access (PEP 562). Importing a submodule such as
+# phone_agent.config.timing then no longer loads the whole package.
+_LAZY_ATTRIBUTES = {
+    "PhoneAgent": ("phone_agent.agent", "PhoneAgent"),
+    "IOSPhoneAgent": ("phone_agent.agent_ios", "IOSPhoneAgent"),
+}
+
+
+__getattr__, __dir__ = lazy_attributes(globals(), _LAZY_ATTRIBUTES)
+
+
 __all__ = ["PhoneAgent", "IOSPhoneAgent"]
@@ -0,0 +1,40 @@
+"""Helpers for package ``__init__`` modules that import attributes on first access."""
+
+import importlib
+from collections.abc import Callable
+from typing import Any
+
+
+def lazy_attributes(
+    module_globals: dict[str, Any], table: dict[str, tuple[str, str]]
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """
+    Build PEP 562 ``__getattr__`` and ``__dir__`` functions for a module.
+
+    Args:
+        module_globals: The calling module's ``globals()``.
+        table: Maps each public name to the ``(module, attribute)`` it is
+            imported from.
+
+    Returns:
+        The ``(__getattr__, __dir__)`` pair to assign in the calling module.
+    """
+    module_name = module_globals["__name__"]
+
+    def __getattr__(name: str) -> Any:
+        try:
+            source, attribute = table[name]
+        except KeyError:
+            raise AttributeError(
+                f"module {module_name!r} has no attribute {name!r}"
+            ) from None
+
+        value = getattr(importlib.import_module(source), attribute)
+        # Cache on the module so later lookups skip __getattr__ entirely
+        module_globals[name] = value
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(module_globals) | set(table))
+
+    return __getattr__, __dir__
@@ -20,6 +20,7 @@ class Screenshot:
     width: int
     height: int
     is_sensitive: bool = False
+    raw_bytes: bytes | None = None  # PNG bytes behind base64_data, if available
 
 
 def get_screenshot(device_id: str | None = None, timeout: int = 10) -> Screenshot:
@@ -71,13 +72,18 @@ def get_screenshot(device_id: str | None = None, timeout: int = 10) -> Screensho
 
         buffered = BytesIO()
         img.save(buffered, format="PNG")
-        base64_data = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        raw_bytes = buffered.getvalue()
+        base64_data = base64.b64encode(raw_bytes).decode("utf-8")
 
         # Cleanup
         os.remove(temp_path)
 
         return Screenshot(
-            base64_data=base64_data, width=width, height=height, is_sensitive=False
+            base64_data=base64_data,
+            width=width,
+            height=height,
+            is_sensitive=False,
+            raw_bytes=raw_bytes,
         )
 
     except Exception as e:
@@ -99,11 +105,13 @@ def _create_fallback_screenshot(is_sensitive: bool) -> Screenshot:
     black_img = Image.new("RGB", (default_width, default_height), color="black")
     buffered = BytesIO()
     black_img.save(buffered, format="PNG")
-    base64_data = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    raw_bytes = buffered.getvalue()
+    base64_data = base64.b64encode(raw_bytes).decode("utf-8")
 
     return Screenshot(
         base64_data=base64_data,
         width=default_width,
         height=default_height,
         is_sensitive=is_sensitive,
+        raw_bytes=raw_bytes,
     )
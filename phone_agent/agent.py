@@ -40,6 +40,7 @@ class StepResult:
     thinking: str
     message: str | None = None
     screenshot: str | None = None  # Base64 encoded screenshot
+    screenshot_bytes: bytes | None = None  # Raw PNG bytes of the same screenshot
 
 
 class PhoneAgent:
@@ -280,6 +281,7 @@ class PhoneAgent:
             thinking=response.thinking,
             message=result.message or action.get("message"),
             screenshot=screenshot.base64_data,
+            screenshot_bytes=screenshot.raw_bytes,
         )
 
     @property
@@ -1,13 +1,7 @@
 """Configuration module for Phone Agent."""
 
-from phone_agent.config.apps import APP_PACKAGES
-from phone_agent.config.apps_ios import APP_PACKAGES_IOS
+from phone_agent._lazy import lazy_attributes
 from phone_agent.config.i18n import get_message, get_messages
-from phone_agent.config.prompts import (
-    SYSTEM_PROMPT_EN,
-    SYSTEM_PROMPT_ZH,
-    get_system_prompt,
-)
 from phone_agent.config.timing import (
     TIMING_CONFIG,
     ActionTimingConfig,
@@ -18,9 +12,21 @@ from phone_agent.config.timing import (
     update_timing_config,
 )
 
+# App tables and prompts are large and usually only one platform/language is
+# needed, so they are imported on first access (PEP 562) instead of eagerly.
+_LAZY_ATTRIBUTES = {
+    "APP_PACKAGES": ("phone_agent.config.apps", "APP_PACKAGES"),
+    "APP_PACKAGES_IOS": ("phone_agent.config.apps_ios", "APP_PACKAGES_IOS"),
+    # Default to Chinese for backward compatibility
+    "SYSTEM_PROMPT": ("phone_agent.config.prompts", "SYSTEM_PROMPT_ZH"),
+    "SYSTEM_PROMPT_ZH": ("phone_agent.config.prompts", "SYSTEM_PROMPT_ZH"),
+    "SYSTEM_PROMPT_EN": ("phone_agent.config.prompts", "SYSTEM_PROMPT_EN"),
+    "get_system_prompt": ("phone_agent.config.prompts", "get_system_prompt"),
+}
+
+
+__getattr__, __dir__ = lazy_attributes(globals(), _LAZY_ATTRIBUTES)
 
-# Default to Chinese for backward compatibility
-SYSTEM_PROMPT = SYSTEM_PROMPT_ZH
 
 __all__ = [
     "APP_PACKAGES",
@@ -1,5 +1,7 @@
 """App name to package name mapping for supported applications."""
 
+import sys
+
 APP_PACKAGES: dict[str, str] = {
     # Social & Messaging
     "微信": "com.tencent.mm",
@@ -186,6 +188,9 @@ APP_PACKAGES: dict[str, str] = {
     "Whatsapp": "com.whatsapp",
     "WhatsApp": "com.whatsapp",
 }
+# App names and packages repeat across the platform tables; intern them so
+# each distinct string is stored once per process
+APP_PACKAGES = {sys.intern(k): sys.intern(v) for k, v in APP_PACKAGES.items()}
 
 
 def get_package_name(app_name: str) -> str | None:
@@ -4,6 +4,8 @@ Maps user-friendly app names to HarmonyOS bundle names.
 These bundle names are used with the 'hdc shell aa start -b <bundle>' command.
 """
 
+import sys
+
 # Custom ability names for apps that don't use the default "EntryAbility"
 # Maps bundle_name -> ability_name
 # Generated by: python test/find_abilities.py
@@ -55,6 +57,8 @@ APP_ABILITIES: dict[str, str] = {
     "com.ohos.contacts": "com.ohos.contacts.MainAbility",
     "com.ohos.mms": "com.ohos.mms.MainAbility",
 }
+# Bundle names repeat between both tables below; intern to store each once
+APP_ABILITIES = {sys.intern(k): sys.intern(v) for k, v in APP_ABILITIES.items()}
 
 APP_PACKAGES: dict[str, str] = {
     # Social & Messaging
@@ -225,6 +229,7 @@ APP_PACKAGES: dict[str, str] = {
     "我的华为": "com.huawei.hmos.myhuawei",
     "华为会员": "com.huawei.hmos.myhuawei",
 }
+APP_PACKAGES = {sys.intern(k): sys.intern(v) for k, v in APP_PACKAGES.items()}
 
 
 def get_package_name(app_name: str) -> str | None:
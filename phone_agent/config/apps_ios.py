@@ -4,6 +4,8 @@ Based on iOS app bundle ID conventions and common iOS applications.
 Bundle IDs are in the format: com.company.appName
 """
 
+import sys
+
 APP_PACKAGES_IOS: dict[str, str] = {
     # Tencent Apps (腾讯系)
     "微信": "com.tencent.xin",
@@ -199,6 +201,8 @@ APP_PACKAGES_IOS: dict[str, str] = {
     "Keynote": "com.apple.Keynote",
     "Keynote 讲演": "com.apple.Keynote",
 }
+# Share app-name strings with the Android and HarmonyOS tables
+APP_PACKAGES_IOS = {sys.intern(k): sys.intern(v) for k, v in APP_PACKAGES_IOS.items()}
 
 
 def get_bundle_id(app_name: str) -> str | None:
@@ -1,5 +1,7 @@
 """Internationalization (i18n) module for Phone Agent UI messages."""
 
+from functools import lru_cache
+
 # Chinese messages
 MESSAGES_ZH = {
     "thinking": "思考过程",
@@ -66,6 +68,7 @@ def get_messages(lang: str = "cn") -> dict:
     return MESSAGES_ZH
 
 
+@lru_cache(maxsize=512)
 def get_message(key: str, lang: str = "cn") -> str:
     """
     Get a single UI message by key and language.
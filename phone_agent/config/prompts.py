@@ -1,6 +1,8 @@
 """System prompts and tool descriptions for the AI agent."""
 
 from datetime import datetime
+from functools import lru_cache
+
 from phone_agent.config.prompts_zh import SYSTEM_PROMPT as SYSTEM_PROMPT_ZH
 from phone_agent.config.prompts_en import SYSTEM_PROMPT as SYSTEM_PROMPT_EN
 
@@ -77,8 +79,9 @@ Your output should STRICTLY follow the format:
 </answer>
 """
 
+@lru_cache(maxsize=None)
 def get_system_prompt(lang: str = "cn", api_type: str = "openai") -> str:
-    """Get the system prompt for the specified language."""
+    """Get the system prompt for the specified language (built once per combination)."""
     prompt = SYSTEM_PROMPT_ZH if lang == "cn" else SYSTEM_PROMPT_EN
     
     # Gemini uses native Tool Calling and native Thought, so we don't need text descriptions.
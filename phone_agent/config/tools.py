@@ -1,5 +1,7 @@
 """Tool definitions for Gemini Native Tool Calling."""
 
+import json
+
 # The count and content of these tools match phone_agent/config/prompts_zh.py exactly.
 GEMINI_TOOLS = [
     {
@@ -221,3 +223,8 @@ GEMINI_TOOLS = [
         ]
     }
 ]
+
+# The tool schema never changes, so serialize it once instead of on every request
+GEMINI_TOOLS_JSON: bytes = json.dumps(
+    GEMINI_TOOLS, ensure_ascii=False, separators=(",", ":")
+).encode("utf-8")
@@ -1,15 +1,22 @@
 """Model client for AI inference using OpenAI-compatible API."""
 
 import json
+import sys
 import time
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
 
 import requests
+from requests.adapters import HTTPAdapter
+
 from phone_agent.config.i18n import get_message
+from phone_agent.model.gemini_handler import gemini_request
+from phone_agent.model.openai_handler import openai_request
+from phone_agent.model.stream_utils import MessageCache
 
 
-@dataclass
+@dataclass(slots=True)
 class ModelConfig:
     """Configuration for the AI model."""
 
@@ -23,9 +30,10 @@ class ModelConfig:
     frequency_penalty: float = 0.2
     extra_body: dict[str, Any] = field(default_factory=dict)
     lang: str = "cn"  # Language for UI messages: 'cn' or 'en'
+    verbose_metrics: bool = True  # Print timing metrics after each request
 
 
-@dataclass
+@dataclass(slots=True)
 class ModelResponse:
     """Response from the AI model."""
 
@@ -41,6 +49,24 @@ class ModelResponse:
     total_time: float | None = None  # Total inference time (seconds)
 
 
+# Request handler for each supported api_type; anything else is treated as OpenAI
+_REQUEST_HANDLERS = {
+    "gemini": gemini_request,
+    "openai": openai_request,
+}
+
+
+@lru_cache(maxsize=None)
+def _metrics_templates(lang: str) -> tuple[str, str, str, str]:
+    """Build the performance metrics block for a language, split at its optional lines."""
+    rule = "=" * 50
+    header = f"\n{rule}\n⏱️  {get_message('performance_metrics', lang)}:\n{'-' * 50}\n"
+    ttft_line = f"{get_message('time_to_first_token', lang)}: {{:.3f}}s\n"
+    tte_line = f"{get_message('time_to_thinking_end', lang)}:        {{:.3f}}s\n"
+    footer = f"{get_message('total_inference_time', lang)}:          {{:.3f}}s\n{rule}\n"
+    return header, ttft_line, tte_line, footer
+
+
 class ModelClient:
     """
     Client for interacting with OpenAI-compatible vision-language models.
@@ -52,29 +78,41 @@ class ModelClient:
     def __init__(self, config: ModelConfig | None = None):
         self.config = config or ModelConfig()
 
+        # Keep connections alive across turns instead of paying DNS/TCP/TLS each time
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json"})
+        self._message_cache = MessageCache()
+
     def request(self, messages: list[dict[str, Any]]) -> ModelResponse:
         """
         Send a request to the model.
         """
-        from phone_agent.model.openai_handler import openai_request
-        from phone_agent.model.gemini_handler import gemini_request
-
-        # Start timing
-        start_time = time.time()
-
-        if self.config.api_type == "gemini":
-            raw_content, thought_signature, time_to_first_token, time_to_thinking_end, structured_action, tool_call_id = gemini_request(
-                self.config, messages, start_time
-            )
-        else:
-            raw_content, thought_signature, time_to_first_token, time_to_thinking_end = openai_request(
-                self.config, messages, start_time
-            )
-            structured_action = None
-            tool_call_id = None
+        # Start timing; handlers report monotonic nanoseconds since start_time
+        start_time = time.monotonic_ns()
+
+        handler = _REQUEST_HANDLERS.get(self.config.api_type, openai_request)
+        (
+            raw_content,
+            thought_signature,
+            time_to_first_token,
+            time_to_thinking_end,
+            structured_action,
+            tool_call_id,
+        ) = handler(
+            self.config, messages, start_time, self._session, self._message_cache
+        )
 
-        # Calculate total time
-        total_time = time.time() - start_time
+        # Calculate total time and convert the handler timings to seconds
+        total_time = (time.monotonic_ns() - start_time) / 1e9
+        time_to_first_token = (
+            time_to_first_token / 1e9 if time_to_first_token >= 0 else None
+        )
+        time_to_thinking_end = (
+            time_to_thinking_end / 1e9 if time_to_thinking_end >= 0 else None
+        )
 
         # Parse thinking and action from response
         if structured_action:
@@ -85,23 +123,16 @@ class ModelClient:
             thinking, action = self._parse_response(raw_content)
 
         # Print performance metrics
-        lang = self.config.lang
-        print()
-        print("=" * 50)
-        print(f"⏱️  {get_message('performance_metrics', lang)}:")
-        print("-" * 50)
-        if time_to_first_token is not None:
-            print(
-                f"{get_message('time_to_first_token', lang)}: {time_to_first_token:.3f}s"
-            )
-        if time_to_thinking_end is not None:
-            print(
-                f"{get_message('time_to_thinking_end', lang)}:        {time_to_thinking_end:.3f}s"
-            )
-        print(
-            f"{get_message('total_inference_time', lang)}:          {total_time:.3f}s"
-        )
-        print("=" * 50)
+        if self.config.verbose_metrics:
+            header, ttft_line, tte_line, footer = _metrics_templates(self.config.lang)
+            lines = [header]
+            if time_to_first_token is not None:
+                lines.append(ttft_line.format(time_to_first_token))
+            if time_to_thinking_end is not None:
+                lines.append(tte_line.format(time_to_thinking_end))
+            lines.append(footer.format(total_time))
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
 
         return ModelResponse(
             thinking=thinking,
@@ -172,14 +203,16 @@ class MessageBuilder:
 
     @staticmethod
     def create_user_message(
-        text: str, image_base64: str | None = None
+        text: str, image_base64: str | bytes | None = None, mime: str = "image/png"
     ) -> dict[str, Any]:
         """
         Create a user message with optional image.
 
         Args:
             text: Text content.
-            image_base64: Optional base64-encoded image.
+            image_base64: Optional base64-encoded image, as str or ASCII bytes.
+                Bytes are spliced into the request body without re-encoding.
+            mime: MIME type of the image.
 
         Returns:
             Message dictionary.
@@ -187,11 +220,10 @@ class MessageBuilder:
         content = []
 
         if image_base64:
+            # Kept as raw base64 plus mime type; each handler builds its own wire
+            # format from it, so the payload is not copied into a data: URL here
             content.append(
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{image_base64}"},
-                }
+                {"type": "image_b64", "mime": mime, "data": image_base64}
             )
 
         content.append({"type": "text", "text": text})
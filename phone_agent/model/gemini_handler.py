@@ -1,9 +1,19 @@
-import json
 import requests
 import time
+from functools import lru_cache
 from typing import Any
 from phone_agent.actions.handler import do, finish
-from phone_agent.config.tools import GEMINI_TOOLS
+from phone_agent.config.tools import GEMINI_TOOLS_JSON
+from phone_agent.model.stream_utils import (
+    ConsoleBuffer,
+    MarkerScanner,
+    MessageCache,
+    base64_bytes,
+    iter_sse_data,
+    json_dumps,
+    json_loads,
+    parse_gemini_chunk,
+)
 
 # Mapping of Gemini Tool Calls to internal actions
 def map_gemini_to_internal(name: str, args: dict) -> dict:
@@ -15,82 +25,165 @@ def map_gemini_to_internal(name: str, args: dict) -> dict:
     
     return do(action=internal_name, **args)
 
-def gemini_request(config, messages: list[dict[str, Any]], start_time: float):
-    """Handle Gemini Native API request."""
-    # Convert OpenAI format to Gemini Native format
-    contents = []
-    system_instruction = None
+def _content_parts(content: Any) -> list[dict[str, Any]]:
+    """Convert OpenAI message content (string or item list) to Gemini parts."""
+    if isinstance(content, str):
+        return [{"text": content}] if content.strip() else []
 
-    for msg in messages:
-        role = msg["role"]
-        content = msg.get("content")
-        
-        parts = []
-        if isinstance(content, str) and content.strip():
-            parts.append({"text": content})
-        elif isinstance(content, list):
-            for item in content:
-                if item["type"] == "text":
-                    parts.append({"text": item["text"]})
-                elif item["type"] == "image_url":
-                    url = item["image_url"]["url"]
-                    if url.startswith("data:"):
-                        header, data = url.split(",", 1)
-                        mime_type = header.split(";")[0].split(":")[1]
-                        parts.append({
-                            "inline_data": {
-                                "mime_type": mime_type,
-                                "data": data
-                            }
-                        })
-        
-        # 1. Handle Tool Calls in Assistant history
-        tool_calls = msg.get("tool_calls")
-        if tool_calls:
-            for tc in tool_calls:
-                fn = tc.get("function", {})
-                try:
-                    args = json.loads(fn.get("arguments", "{}"))
-                except:
-                    args = {}
+    parts = []
+    if isinstance(content, list):
+        for item in content:
+            if item["type"] == "text":
+                parts.append({"text": item["text"]})
+            elif item["type"] == "image_b64":
                 parts.append({
-                    "functionCall": {
-                        "name": fn.get("name"),
-                        "args": args
+                    "inline_data": {
+                        "mime_type": item["mime"],
+                        "data": item["data"]
                     }
                 })
+            elif item["type"] == "image_url":
+                url = item["image_url"]["url"]
+                if url.startswith("data:"):
+                    header, _, data = url.partition(",")
+                    mime_type = header[5:].partition(";")[0]
+                    parts.append({
+                        "inline_data": {
+                            "mime_type": mime_type,
+                            "data": data
+                        }
+                    })
+    return parts
 
-        # 2. Handle Tool Responses (Results) in history
-        if role == "tool":
-            try:
-                res_content = json.loads(msg.get("content", "{}"))
-            except:
-                res_content = {"result": msg.get("content")}
-            contents.append({
-                "role": "user", # Gemini expects functionResponse from user role
-                "parts": [{
-                    "functionResponse": {
-                        "name": msg.get("name"),
-                        "response": res_content
-                    }
-                }]
+
+def _translate_system(msg: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    return "system", {"parts": _content_parts(msg.get("content"))}
+
+
+def _translate_user(msg: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    return "content", {"role": "user", "parts": _content_parts(msg.get("content"))}
+
+
+def _translate_tool(msg: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    # Handle Tool Responses (Results) in history
+    try:
+        res_content = json_loads(msg.get("content", "{}"))
+    except (ValueError, TypeError):
+        res_content = {"result": msg.get("content")}
+    return "content", {
+        "role": "user", # Gemini expects functionResponse from user role
+        "parts": [{
+            "functionResponse": {
+                "name": msg.get("name"),
+                "response": res_content
+            }
+        }]
+    }
+
+
+def _translate_model(msg: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    parts = _content_parts(msg.get("content"))
+
+    # Handle Tool Calls in Assistant history
+    tool_calls = msg.get("tool_calls")
+    if tool_calls:
+        for tc in tool_calls:
+            fn = tc.get("function", {})
+            arguments = fn.get("arguments", "{}")
+            # Most calls carry no arguments, so skip the decoder for those
+            if not arguments or arguments == "{}":
+                args = {}
+            else:
+                try:
+                    args = json_loads(arguments)
+                except (ValueError, TypeError):
+                    args = {}
+            parts.append({
+                "functionCall": {
+                    "name": fn.get("name"),
+                    "args": args
+                }
             })
-            continue
-
-        # Add thought signature if present (Crucial for Gemini 3)
-        extra = msg.get("extra_content")
-        if extra and isinstance(extra, dict):
-            google_extra = extra.get("google")
-            if google_extra and isinstance(google_extra, dict):
-                sig = google_extra.get("thought_signature")
-                if sig and parts:
-                    parts[0]["thought_signature"] = sig
-
-        if role == "system":
-            system_instruction = {"parts": parts}
+
+    # Add thought signature if present (Crucial for Gemini 3)
+    extra = msg.get("extra_content")
+    if extra and isinstance(extra, dict):
+        google_extra = extra.get("google")
+        if google_extra and isinstance(google_extra, dict):
+            sig = google_extra.get("thought_signature")
+            if sig and parts:
+                parts[0]["thought_signature"] = sig
+
+    return "content", {"role": "model", "parts": parts}
+
+
+# One specialized translator per role instead of re-testing every field of
+# every message; unknown roles are treated as model turns, as before
+_TRANSLATORS = {
+    "system": _translate_system,
+    "user": _translate_user,
+    "tool": _translate_tool,
+}
+
+
+def _translate_message(msg: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    """
+    Convert one OpenAI-format message to Gemini Native format.
+
+    Returns:
+        Tuple of (kind, translated), where kind is "system" for the system
+        instruction and "content" for an entry of the contents list.
+    """
+    return _TRANSLATORS.get(msg["role"], _translate_model)(msg)
+
+
+@lru_cache(maxsize=None)
+def _inline_data_prefix(mime: str) -> bytes:
+    return b'{"inline_data":{"mime_type":' + json_dumps(mime) + b',"data":"'
+
+
+def _encode_part(part: dict[str, Any]) -> bytes:
+    inline_data = part.get("inline_data")
+    if inline_data is None:
+        return json_dumps(part)
+    # Splice the image payload rather than running it through the encoder
+    return (
+        _inline_data_prefix(inline_data["mime_type"])
+        + base64_bytes(inline_data["data"]) + b'"}}'
+    )
+
+
+def _encode_message(msg: dict[str, Any]) -> tuple[str, bytes]:
+    """Translate a message and serialize it for the request body."""
+    kind, translated = _translate_message(msg)
+    if msg["role"] != "user":
+        return kind, json_dumps(translated)
+
+    # User turns carry the screenshots
+    parts = b",".join(_encode_part(part) for part in translated["parts"])
+    return kind, b'{"role":"user","parts":[' + parts + b"]}"
+
+
+def gemini_request(
+    config,
+    messages: list[dict[str, Any]],
+    start_time: int,
+    session: requests.Session,
+    message_cache: MessageCache,
+):
+    """Handle Gemini Native API request."""
+    # Convert OpenAI format to Gemini Native format. Earlier turns are already
+    # translated and serialized in the cache, so only new messages cost work.
+    contents = []
+    system_instruction = None
+
+    for msg in messages:
+        kind, encoded = message_cache.get(msg, _encode_message)
+        if kind == "system":
+            system_instruction = encoded
         else:
-            gemini_role = "user" if role == "user" else "model"
-            contents.append({"role": gemini_role, "parts": parts})
+            contents.append(encoded)
+    message_cache.retain(messages)
 
     # Prepare URL and Headers
     base = config.base_url.rstrip("/")
@@ -98,141 +191,110 @@ def gemini_request(config, messages: list[dict[str, Any]], start_time: float):
     url = f"{base}/models/{config.model_name}:streamGenerateContent?alt=sse"
     
     headers = {
-        "Content-Type": "application/json",
         "x-goog-api-key": config.api_key
     }
     
-    payload = {
-        "contents": contents,
-        "tools": GEMINI_TOOLS,
-        "generationConfig": {
-            "maxOutputTokens": config.max_tokens,
-            "temperature": config.temperature,
-            "topP": config.top_p,
-            "candidateCount": 1,
-            "thinkingConfig": {
-                "includeThoughts": True
-            }
+    generation_config = {
+        "maxOutputTokens": config.max_tokens,
+        "temperature": config.temperature,
+        "topP": config.top_p,
+        "candidateCount": 1,
+        "thinkingConfig": {
+            "includeThoughts": True
         }
     }
-    if system_instruction:
-        payload["systemInstruction"] = system_instruction
-    
     # Merge extra_body into generationConfig if any
     if config.extra_body:
-        payload["generationConfig"].update(config.extra_body)
+        generation_config.update(config.extra_body)
+
+    # Splice the pre-serialized tool schema instead of re-encoding it every call
+    body = (
+        b'{"contents":[' + b",".join(contents) + b"]"
+        + b',"tools":' + GEMINI_TOOLS_JSON
+        + b',"generationConfig":' + json_dumps(generation_config)
+    )
+    if system_instruction is not None:
+        body += b',"systemInstruction":' + system_instruction
+    body += b"}"
 
-    response = requests.post(url, headers=headers, json=payload, stream=True)
-    response.raise_for_status()
+    response = session.post(url, headers=headers, data=body, stream=True)
 
-    raw_content = ""
+    # Collected as pieces and joined once; += on a str is quadratic over a long stream
+    raw_parts: list[str] = []
     thought_signature = None
     structured_action = None
     tool_call_id = None
-    buffer = ""
-    action_markers = ["finish(message=", "do(action="]
+    scanner = MarkerScanner()
+    console = ConsoleBuffer()
     in_action_phase = False
     in_thought_phase = False
-    first_token_received = False
-    time_to_first_token = None
-    time_to_thinking_end = None
-
-    for line in response.iter_lines():
-        if not line:
-            continue
-        
-        line = line.decode("utf-8")
-        if not line.startswith("data: "):
-            continue
-        
-        data_str = line[6:].strip()
-        try:
-            chunk = json.loads(data_str)
-        except json.JSONDecodeError:
-            continue
-        
-        # Gemini native stream response has 'candidates'
-        if not chunk.get("candidates"):
-            continue
-        
-        candidate = chunk["candidates"][0]
-        content_obj = candidate.get("content", {})
-        parts = content_obj.get("parts", [])
-        
-        for part in parts:
-            # Extract thought signature
-            sig = part.get("thoughtSignature")
-            if sig:
-                thought_signature = sig
-                
-            # Handle native Tool Calls
-            if "functionCall" in part:
-                if in_thought_phase:
-                    in_thought_phase = False
-                
-                fc = part["functionCall"]
-                # Capture tool_call_id if provided by the API
-                tool_call_id = fc.get("id")
-                structured_action = map_gemini_to_internal(fc["name"], fc.get("args", {}))
-                
-                if not in_action_phase:
-                    in_action_phase = True
-                    if time_to_thinking_end is None:
-                        time_to_thinking_end = time.time() - start_time
+    # Timings are monotonic nanoseconds since start_time; -1 until observed
+    time_to_first_token = -1
+    time_to_thinking_end = -1
+
+    try:
+        response.raise_for_status()
+
+        for data in iter_sse_data(response):
+            try:
+                parts = parse_gemini_chunk(data)
+            except ValueError:
                 continue
 
-            # Handle Thinking and regular text
-            text = part.get("text")
-            if text:
-                is_thought = part.get("thought", False)
-                
-                if not first_token_received:
-                    time_to_first_token = time.time() - start_time
-                    first_token_received = True
-                
-                if is_thought:
-                    in_thought_phase = True
-                    # Native thought: print directly and wrap in <think> for raw_content
-                    raw_content += f"<think>{text}</think>"
-                    continue
+            for text, is_thought, sig, function_call in parts:
+                # Extract thought signature
+                if sig:
+                    thought_signature = sig
 
-                if in_thought_phase:
-                    in_thought_phase = False
-                    if time_to_thinking_end is None:
-                        time_to_thinking_end = time.time() - start_time
+                # Handle native Tool Calls
+                if function_call is not None:
+                    if in_thought_phase:
+                        in_thought_phase = False
 
-                raw_content += text
-                if in_action_phase:
-                    continue
-                
-                buffer += text
-                
-                marker_found = False
-                for marker in action_markers:
-                    if marker in buffer:
-                        thinking_part = buffer.split(marker, 1)[0]
-                        print(thinking_part, end="", flush=True)
-                        print()
+                    name, args, call_id = function_call
+                    # Capture tool_call_id if provided by the API
+                    tool_call_id = call_id
+                    structured_action = map_gemini_to_internal(name, args)
+
+                    if not in_action_phase:
                         in_action_phase = True
-                        marker_found = True
-                        if time_to_thinking_end is None:
-                            time_to_thinking_end = time.time() - start_time
-                        break
-                
-                if marker_found:
+                        if time_to_thinking_end < 0:
+                            time_to_thinking_end = time.monotonic_ns() - start_time
                     continue
-                
-                is_potential_marker = False
-                for marker in action_markers:
-                    for i in range(1, len(marker)):
-                        if buffer.endswith(marker[:i]):
-                            is_potential_marker = True
-                            break
-                    if is_potential_marker:
-                        break
-                
-                if not is_potential_marker:
-                    print(buffer, end="", flush=True)
-                    buffer = ""
-
-    return raw_content, thought_signature, time_to_first_token, time_to_thinking_end, structured_action, tool_call_id
+
+                # Handle Thinking and regular text
+                if text:
+
+                    if time_to_first_token < 0:
+                        time_to_first_token = time.monotonic_ns() - start_time
+
+                    if is_thought:
+                        in_thought_phase = True
+                        # Native thought: print directly and wrap in <think> for raw_content
+                        raw_parts.append(f"<think>{text}</think>")
+                        continue
+
+                    if in_thought_phase:
+                        in_thought_phase = False
+                        if time_to_thinking_end < 0:
+                            time_to_thinking_end = time.monotonic_ns() - start_time
+
+                    raw_parts.append(text)
+                    if in_action_phase:
+                        continue
+
+                    printable, marker_found = scanner.feed(text)
+                    console.write(printable)
+
+                    if marker_found:
+                        console.write("\n")
+                        in_action_phase = True
+                        if time_to_thinking_end < 0:
+                            time_to_thinking_end = time.monotonic_ns() - start_time
+    finally:
+        # A fully read body hands the connection back to the session pool;
+        # on an HTTP error or an exception mid-stream it is closed instead
+        # of staying checked out until garbage collection
+        response.close()
+        console.flush()
+    return "".join(raw_parts), thought_signature, time_to_first_token, time_to_thinking_end, structured_action, tool_call_id
@@ -1,18 +1,63 @@
-import json
-import requests
 import time
+from functools import lru_cache
 from typing import Any
 
-def openai_request(config, messages: list[dict[str, Any]], start_time: float):
+import requests
+
+from phone_agent.model.stream_utils import (
+    ConsoleBuffer,
+    MarkerScanner,
+    MessageCache,
+    base64_bytes,
+    iter_sse_data,
+    json_dumps,
+    parse_openai_chunk,
+)
+
+
+@lru_cache(maxsize=None)
+def _image_url_prefix(mime: str) -> bytes:
+    return b'{"type":"image_url","image_url":{"url":"data:' + mime.encode("ascii") + b";base64,"
+
+
+def _encode_message(msg: dict[str, Any]) -> bytes:
+    """Serialize a message, expanding internal image items to OpenAI image_url parts."""
+    content = msg.get("content")
+    if not isinstance(content, list) or not any(
+        item.get("type") == "image_b64" for item in content
+    ):
+        return json_dumps(msg)
+
+    items = []
+    for item in content:
+        if item.get("type") == "image_b64":
+            # Splice the base64 payload straight into the bytes instead of
+            # building a data: URL string and encoding that again
+            items.append(
+                _image_url_prefix(item["mime"]) + base64_bytes(item["data"]) + b'"}}'
+            )
+        else:
+            items.append(json_dumps(item))
+
+    head = json_dumps({key: value for key, value in msg.items() if key != "content"})
+    head = head[:-1] + b"," if len(head) > 2 else b"{"
+    return head + b'"content":[' + b",".join(items) + b"]}"
+
+
+def openai_request(
+    config,
+    messages: list[dict[str, Any]],
+    start_time: int,
+    session: requests.Session,
+    message_cache: MessageCache,
+):
     """Handle OpenAI-compatible API request."""
     url = f"{config.base_url}/chat/completions"
     headers = {
-        "Content-Type": "application/json",
         "Authorization": f"Bearer {config.api_key}",
     }
     payload = {
         "model": config.model_name,
-        "messages": messages,
         "max_tokens": config.max_tokens,
         "temperature": config.temperature,
         "top_p": config.top_p,
@@ -21,88 +66,70 @@ def openai_request(config, messages: list[dict[str, Any]], start_time: float):
         **config.extra_body,
     }
 
-    response = requests.post(url, headers=headers, json=payload, stream=True)
-    response.raise_for_status()
+    # History messages (notably the system prompt) are encoded once and reused
+    encoded_messages = [message_cache.get(msg, _encode_message) for msg in messages]
+    message_cache.retain(messages)
+    body = (
+        b'{"messages":[' + b",".join(encoded_messages) + b"],"
+        # Reuse the remaining fields without their opening brace
+        + json_dumps(payload)[1:]
+    )
+
+    response = session.post(url, headers=headers, data=body, stream=True)
 
-    raw_content = ""
+    # Collected as pieces and joined once; += on a str is quadratic over a long stream
+    raw_parts: list[str] = []
     thought_signature = None
-    buffer = ""
-    action_markers = ["finish(message=", "do(action="]
+    scanner = MarkerScanner()
+    console = ConsoleBuffer()
     in_action_phase = False
-    first_token_received = False
-    time_to_first_token = None
-    time_to_thinking_end = None
-
-    for line in response.iter_lines():
-        if not line:
-            continue
-
-        line = line.decode("utf-8")
-        if not line.startswith("data: "):
-            continue
-
-        data_str = line[6:].strip()
-        if data_str == "[DONE]":
-            break
-
-        try:
-            chunk = json.loads(data_str)
-        except json.JSONDecodeError:
-            continue
-
-        if not chunk.get("choices"):
-            continue
-
-        delta = chunk["choices"][0].get("delta", {})
-
-        # Extract thought signature for OpenAI compatibility mode (e.g. via OpenRouter/Google Proxy)
-        extra = delta.get("extra_content")
-        if extra and isinstance(extra, dict):
-            google_extra = extra.get("google")
-            if google_extra and isinstance(google_extra, dict):
-                sig = google_extra.get("thought_signature")
-                if sig:
-                    thought_signature = sig
-
-        if delta.get("content") is not None:
-            content = delta["content"]
-            raw_content += content
-
-            if not first_token_received:
-                time_to_first_token = time.time() - start_time
-                first_token_received = True
-
-            if in_action_phase:
-                continue
+    # Timings are monotonic nanoseconds since start_time; -1 until observed
+    time_to_first_token = -1
+    time_to_thinking_end = -1
 
-            buffer += content
+    try:
+        response.raise_for_status()
 
-            marker_found = False
-            for marker in action_markers:
-                if marker in buffer:
-                    thinking_part = buffer.split(marker, 1)[0]
-                    print(thinking_part, end="", flush=True)
-                    print()
-                    in_action_phase = True
-                    marker_found = True
-                    if time_to_thinking_end is None:
-                        time_to_thinking_end = time.time() - start_time
-                    break
+        for data in iter_sse_data(response):
+            if data == b"[DONE]":
+                # Keep reading to the end of the body: urllib3 only returns the
+                # connection to the pool once the response is fully consumed
+                continue
 
-            if marker_found:
+            try:
+                parsed = parse_openai_chunk(data)
+            except ValueError:
                 continue
 
-            is_potential_marker = False
-            for marker in action_markers:
-                for i in range(1, len(marker)):
-                    if buffer.endswith(marker[:i]):
-                        is_potential_marker = True
-                        break
-                if is_potential_marker:
-                    break
+            if parsed is None:
+                continue
+
+            content, sig = parsed
+            if sig:
+                thought_signature = sig
+
+            if content is not None:
+                raw_parts.append(content)
 
-            if not is_potential_marker:
-                print(buffer, end="", flush=True)
-                buffer = ""
+                if time_to_first_token < 0:
+                    time_to_first_token = time.monotonic_ns() - start_time
 
-    return raw_content, thought_signature, time_to_first_token, time_to_thinking_end
+                if in_action_phase:
+                    continue
+
+                printable, marker_found = scanner.feed(content)
+                console.write(printable)
+
+                if marker_found:
+                    console.write("\n")
+                    in_action_phase = True
+                    if time_to_thinking_end < 0:
+                        time_to_thinking_end = time.monotonic_ns() - start_time
+    finally:
+        # A fully read body hands the connection back to the session pool;
+        # on an HTTP error or an exception mid-stream it is closed instead
+        # of staying checked out until garbage collection
+        response.close()
+        console.flush()
+    # Text-only protocol: no native tool call or call id
+    return "".join(raw_parts), thought_signature, time_to_first_token, time_to_thinking_end, None, None
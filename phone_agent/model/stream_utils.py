@@ -0,0 +1,488 @@
+"""Shared helpers for streaming model responses."""
+
+import re
+import sys
+import time
+from typing import Any, Callable, Iterator, TypeVar
+
+try:
+    # orjson decodes bytes directly and is considerably faster on small frames
+    from orjson import dumps as json_dumps
+    from orjson import loads as json_loads
+except ImportError:
+    import json
+    from json import loads as json_loads
+
+    def json_dumps(obj: Any) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Plain-text action markers that end the thinking phase of a response
+ACTION_MARKERS = ("finish(message=", "do(action=")
+
+
+def _build_marker_automaton(
+    markers: tuple[str, ...],
+) -> tuple[list[dict[str, int]], list[int], list[int]]:
+    """
+    Build a deterministic Aho-Corasick automaton over the given markers.
+
+    Each state corresponds to a prefix of some marker; its depth is the prefix
+    length, which is exactly how many trailing characters must be held back
+    because a marker might still be completing.
+
+    Returns:
+        Tuple of (transitions, depths, matches) indexed by state, where
+        matches holds the length of the marker ending at that state (or 0).
+    """
+    goto: list[dict[str, int]] = [{}]
+    depths = [0]
+    matches = [0]
+
+    for marker in markers:
+        state = 0
+        for ch in marker:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                depths.append(depths[state] + 1)
+                matches.append(0)
+            state = nxt
+        matches[state] = len(marker)
+
+    # Breadth-first pass to fold failure links into a complete transition table
+    alphabet = {ch for marker in markers for ch in marker}
+    transitions: list[dict[str, int]] = [{} for _ in goto]
+    fail = [0] * len(goto)
+    queue = []
+    for ch in alphabet:
+        nxt = goto[0].get(ch, 0)
+        transitions[0][ch] = nxt
+        if nxt:
+            queue.append(nxt)
+
+    while queue:
+        state = queue.pop(0)
+        matches[state] = matches[state] or matches[fail[state]]
+        for ch in alphabet:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                transitions[state][ch] = transitions[fail[state]][ch]
+            else:
+                fail[nxt] = transitions[fail[state]][ch]
+                transitions[state][ch] = nxt
+                queue.append(nxt)
+
+    # Characters outside the alphabet always reset to the root, so drop them
+    for table in transitions:
+        for ch in [ch for ch, nxt in table.items() if nxt == 0]:
+            del table[ch]
+
+    return transitions, depths, matches
+
+
+MARKER_AUTOMATON = _build_marker_automaton(ACTION_MARKERS)
+
+# Matches any character that can leave the root state (the first character
+# of a marker), letting the scanner skip unrelated text at C speed
+_MARKER_HEAD_RE = re.compile(
+    "[" + "".join(re.escape(ch) for ch in sorted(MARKER_AUTOMATON[0][0])) + "]"
+)
+
+
+class MarkerScanner:
+    """
+    Incrementally detect action markers in streamed text.
+
+    Only newly received text is examined, so the cost per chunk is linear in
+    the chunk size rather than in the length of everything seen so far.
+    """
+
+    def __init__(self):
+        self._state = 0
+        self._pending = ""
+
+    @property
+    def pending_partial_len(self) -> int:
+        """Length of the trailing text that may still become a marker."""
+        return len(self._pending)
+
+    def feed(self, text: str) -> tuple[str, bool]:
+        """
+        Consume a chunk of streamed text.
+
+        Args:
+            text: Newly received text.
+
+        Returns:
+            Tuple of (printable text, marker found). When a marker is found the
+            printable text is everything before it; otherwise it excludes the
+            trailing partial marker, which is held back for the next chunk.
+        """
+        transitions, depths, matches = MARKER_AUTOMATON
+        state = self._state
+        pos = 0
+        end = len(text)
+
+        while pos < end:
+            if not state:
+                # Nothing is pending, so jump straight to the next character
+                # that could start a marker instead of stepping through text
+                head = _MARKER_HEAD_RE.search(text, pos)
+                if head is None:
+                    break
+                pos = head.start()
+
+            state = transitions[state].get(text[pos], 0)
+            if matches[state]:
+                combined = self._pending + text[: pos + 1]
+                self._state = 0
+                self._pending = ""
+                return combined[: len(combined) - matches[state]], True
+            pos += 1
+
+        self._state = state
+        combined = self._pending + text
+        depth = depths[state]
+        if not depth:
+            self._pending = ""
+            return combined, False
+        self._pending = combined[-depth:]
+        return combined[:-depth], False
+
+
+T = TypeVar("T")
+
+
+class MessageCache:
+    """
+    Memoize per-message request work across turns of a conversation.
+
+    Most of the history is identical from one turn to the next, so whatever a
+    handler derives from a message (translation, serialized bytes) is kept,
+    keyed by message identity. An entry is only reused while the message still
+    holds the same content object, so messages whose content is replaced (for
+    example when images are stripped) are rebuilt.
+    """
+
+    def __init__(self):
+        self._entries: dict[int, tuple[dict[str, Any], Any, Any]] = {}
+
+    def get(self, message: dict[str, Any], build: Callable[[dict[str, Any]], T]) -> T:
+        """
+        Get the cached value for a message, building it on a miss.
+
+        Args:
+            message: Conversation message.
+            build: Function deriving the value from the message.
+
+        Returns:
+            The cached or freshly built value.
+        """
+        entry = self._entries.get(id(message))
+        content = message.get("content")
+        if entry is not None and entry[0] is message and entry[1] is content:
+            return entry[2]
+
+        value = build(message)
+        # Holding the message keeps its id from being reused while cached
+        self._entries[id(message)] = (message, content, value)
+        return value
+
+    def retain(self, messages: list[dict[str, Any]]) -> None:
+        """Drop entries for messages that are no longer in the conversation."""
+        live = {id(message) for message in messages}
+        for key in [key for key in self._entries if key not in live]:
+            del self._entries[key]
+
+
+class ConsoleBuffer:
+    """
+    Batch streamed text before writing it to stdout.
+
+    Flushing on every token costs a write syscall per chunk; instead text is
+    collected and flushed on newlines, once enough has accumulated, or when
+    the last flush is older than a short delay.
+
+    Args:
+        max_chars: Flush once this many characters are pending.
+        max_delay: Flush once this many seconds passed since the last flush.
+    """
+
+    def __init__(self, max_chars: int = 512, max_delay: float = 0.05):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._parts: list[str] = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, text: str) -> None:
+        """Queue text, flushing if any threshold is reached."""
+        if not text:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+        if (
+            "\n" in text
+            or self._size >= self.max_chars
+            or time.monotonic() - self._last_flush > self.max_delay
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all pending text to stdout."""
+        if self._parts:
+            sys.stdout.write("".join(self._parts))
+            self._parts.clear()
+            self._size = 0
+        sys.stdout.flush()
+        self._last_flush = time.monotonic()
+
+
+def _iter_body(response) -> Iterator[bytes]:
+    """
+    Yield the body of a streamed response as soon as each piece arrives.
+
+    chunk_size=None yields one transfer chunk per read, but on a body that is
+    delimited by connection close urllib3 turns it into a read to EOF; a
+    fixed size has the same problem whenever frames are smaller than it.
+    Those bodies are read with read1, which returns whatever is available.
+    """
+    raw = getattr(response, "raw", None)
+    if getattr(raw, "chunked", False):
+        yield from response.iter_content(chunk_size=None)
+    elif hasattr(raw, "read1"):
+        while chunk := raw.read1(65536, decode_content=True):
+            yield chunk
+    else:
+        # Same read size iter_lines used
+        yield from response.iter_content(chunk_size=512)
+
+
+def iter_sse_data(response) -> Iterator[bytes]:
+    """
+    Yield the payload of each SSE ``data:`` line of a streamed response.
+
+    Reads the body as it arrives and splits it on newlines in place, so one
+    network read can produce several frames without iter_lines' per-line
+    buffering and decoding.
+    """
+    buffer = b""
+    for chunk in _iter_body(response):
+        # The carried-over partial line has no newline; only scan the new bytes
+        scan_from = len(buffer)
+        buffer += chunk
+        start = 0
+        while (newline := buffer.find(b"\n", scan_from)) != -1:
+            line = buffer[start:newline]
+            start = scan_from = newline + 1
+            if line.startswith(b"data: "):
+                yield line[6:].strip()
+        buffer = buffer[start:]
+
+    if buffer.startswith(b"data: "):
+        yield buffer[6:].strip()
+
+
+def base64_bytes(data: str | bytes) -> bytes:
+    """
+    Return base64 image data as ASCII bytes for splicing into a request body.
+
+    The base64 alphabet never needs JSON escaping, so the payload can be
+    copied in directly instead of being scanned by the JSON encoder.
+    """
+    return data if isinstance(data, bytes) else data.encode("ascii")
+
+
+# A streamed Gemini part as (text, is_thought, thought_signature, function_call),
+# where function_call is (name, args, id) or None
+GeminiPart = tuple[str | None, bool, str | None, tuple[str, dict, str | None] | None]
+
+
+def _parse_openai_dict(chunk: dict[str, Any]) -> tuple[str | None, str | None] | None:
+    """Extract (content, thought_signature) from a decoded OpenAI chunk."""
+    if not chunk.get("choices"):
+        return None
+
+    delta = chunk["choices"][0].get("delta", {})
+
+    # Thought signature for OpenAI compatibility mode (e.g. via OpenRouter/Google Proxy)
+    signature = None
+    extra = delta.get("extra_content")
+    if extra and isinstance(extra, dict):
+        google_extra = extra.get("google")
+        if google_extra and isinstance(google_extra, dict):
+            signature = google_extra.get("thought_signature")
+
+    return delta.get("content"), signature
+
+
+def _parse_gemini_dict(chunk: dict[str, Any]) -> list[GeminiPart]:
+    """Extract the parts of the first candidate from a decoded Gemini chunk."""
+    if not chunk.get("candidates"):
+        return []
+
+    content_obj = chunk["candidates"][0].get("content", {})
+    parts = []
+    for part in content_obj.get("parts", []):
+        function_call = None
+        if "functionCall" in part:
+            fc = part["functionCall"]
+            function_call = (fc["name"], fc.get("args", {}), fc.get("id"))
+        parts.append(
+            (
+                part.get("text"),
+                part.get("thought", False),
+                part.get("thoughtSignature"),
+                function_call,
+            )
+        )
+    return parts
+
+
+if msgspec is not None:
+    # Typed views of the few fields the handlers read. Decoding straight into
+    # these skips building a dict tree for every streamed frame.
+
+    class _OpenAIGoogleExtra(msgspec.Struct):
+        thought_signature: str | None = None
+
+    class _OpenAIExtra(msgspec.Struct):
+        google: _OpenAIGoogleExtra | None = None
+
+    class _OpenAIDelta(msgspec.Struct):
+        content: str | None = None
+        extra_content: _OpenAIExtra | None = None
+
+    class _OpenAIChoice(msgspec.Struct):
+        delta: _OpenAIDelta = msgspec.field(default_factory=_OpenAIDelta)
+
+    class _OpenAIChunk(msgspec.Struct):
+        choices: list[_OpenAIChoice] = []
+
+    class _GeminiFunctionCall(msgspec.Struct):
+        name: str
+        args: dict[str, Any] = {}
+        id: str | None = None
+
+    class _GeminiPart(msgspec.Struct):
+        text: str | None = None
+        thought: bool = False
+        thoughtSignature: str | None = None
+        functionCall: _GeminiFunctionCall | None = None
+
+    class _GeminiContent(msgspec.Struct):
+        parts: list[_GeminiPart] = []
+
+    class _GeminiCandidate(msgspec.Struct):
+        content: _GeminiContent = msgspec.field(default_factory=_GeminiContent)
+
+    class _GeminiChunk(msgspec.Struct):
+        candidates: list[_GeminiCandidate] = []
+
+    _OPENAI_DECODER = msgspec.json.Decoder(_OpenAIChunk)
+    _GEMINI_DECODER = msgspec.json.Decoder(_GeminiChunk)
+
+    def parse_openai_chunk(data: bytes) -> tuple[str | None, str | None] | None:
+        """
+        Parse one OpenAI-compatible SSE frame.
+
+        Args:
+            data: JSON payload of the frame.
+
+        Returns:
+            Tuple of (content, thought_signature), or None if the frame has
+            no choices.
+
+        Raises:
+            ValueError: If the payload is not valid JSON.
+        """
+        try:
+            chunk = _OPENAI_DECODER.decode(data)
+        except msgspec.ValidationError:
+            # Unexpected shape, let the generic path sort it out
+            return _parse_openai_dict(json_loads(data))
+
+        if not chunk.choices:
+            return None
+
+        delta = chunk.choices[0].delta
+        extra = delta.extra_content
+        signature = extra.google.thought_signature if extra and extra.google else None
+        return delta.content, signature
+
+    def parse_gemini_chunk(data: bytes) -> list[GeminiPart]:
+        """
+        Parse one Gemini native SSE frame.
+
+        Args:
+            data: JSON payload of the frame.
+
+        Returns:
+            Parts of the first candidate, empty if there are none.
+
+        Raises:
+            ValueError: If the payload is not valid JSON.
+        """
+        try:
+            chunk = _GEMINI_DECODER.decode(data)
+        except msgspec.ValidationError:
+            return _parse_gemini_dict(json_loads(data))
+
+        if not chunk.candidates:
+            return []
+
+        parts = []
+        for part in chunk.candidates[0].content.parts:
+            fc = part.functionCall
+            parts.append(
+                (
+                    part.text,
+                    part.thought,
+                    part.thoughtSignature,
+                    (fc.name, fc.args, fc.id) if fc is not None else None,
+                )
+            )
+        return parts
+
+else:
+
+    def parse_openai_chunk(data: bytes) -> tuple[str | None, str | None] | None:
+        """
+        Parse one OpenAI-compatible SSE frame.
+
+        Args:
+            data: JSON payload of the frame.
+
+        Returns:
+            Tuple of (content, thought_signature), or None if the frame has
+            no choices.
+
+        Raises:
+            ValueError: If the payload is not valid JSON.
+        """
+        return _parse_openai_dict(json_loads(data))
+
+    def parse_gemini_chunk(data: bytes) -> list[GeminiPart]:
+        """
+        Parse one Gemini native SSE frame.
+
+        Args:
+            data: JSON payload of the frame.
+
+        Returns:
+            Parts of the first candidate, empty if there are none.
+
+        Raises:
+            ValueError: If the payload is not valid JSON.
+        """
+        return _parse_gemini_dict(json_loads(data))
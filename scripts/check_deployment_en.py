@@ -1,8 +1,151 @@
 import argparse
 import json
 import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Run as a plain script, so make the repository's phone_agent package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phone_agent.model.stream_utils import iter_sse_data  # noqa: E402
+
+try:
+    # orjson is optional; it is much faster on payloads with base64 screenshots
+    from orjson import dumps as json_dumps
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+    def json_dumps(obj) -> bytes:
+        """Serialize obj to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+# (connect, read) timeout in seconds; the read timeout has to cover a full
+# non-streamed generation in batch mode
+REQUEST_TIMEOUT = (3.05, 120)
+
+# Pooled keep-alive session so retries and repeated probes reuse the connection
+session = requests.Session()
+session.headers.update({"Connection": "keep-alive"})
+
+
+def mount_adapter(pool_maxsize: int) -> None:
+    """Mount a retrying adapter that keeps up to pool_maxsize connections per host."""
+    adapter = HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=2, backoff_factor=0.2),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+mount_adapter(8)
+
+
+def timed_completion(url: str, headers: dict, body: bytes) -> tuple[float, dict]:
+    """Send one encoded completion request and return its latency in seconds with the response data."""
+    start = time.perf_counter()
+    response = session.post(url, headers=headers, data=body, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = json_loads(response.content)
+    return time.perf_counter() - start, data
+
+
+def stream_completion(url: str, headers: dict, payload: dict) -> dict | None:
+    """Stream one completion, writing tokens as they arrive, and return the usage if reported."""
+    payload = {
+        **payload,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    usage = None
+    with session.post(
+        url,
+        headers=headers,
+        data=json_dumps(payload),
+        timeout=REQUEST_TIMEOUT,
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        # Same frame reader as the model client: tokens are written as soon as
+        # they arrive instead of waiting for iter_lines' 512-byte reads
+        for data in iter_sse_data(response):
+            if data == b"[DONE]":
+                break
+
+            chunk = json_loads(data)
+            # The usage-only chunk sent with include_usage has no choices
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices") or []:
+                content = (choice.get("delta") or {}).get("content")
+                if content:
+                    sys.stdout.write(content)
+                    sys.stdout.flush()
+    sys.stdout.write("\n")
+    return usage
+
+
+def run_batch(url: str, headers: dict, payload: dict, batch: int, concurrency: int):
+    """Send the same request batch times over the shared session and report latency stats."""
+    # Every request is identical, so encode the body once
+    body = json_dumps(payload)
+    print(f"\nSending {batch} requests with concurrency {concurrency}...")
+    latencies = []
+    completion_tokens = 0
+    errors = 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(timed_completion, url, headers, body)
+            for _ in range(batch)
+        ]
+        for future in as_completed(futures):
+            try:
+                latency, data = future.result()
+            except Exception as e:
+                errors += 1
+                print(f"  - Request failed: {type(e).__name__}: {e}")
+                continue
+            latencies.append(latency)
+            completion_tokens += (data.get("usage") or {}).get("completion_tokens") or 0
+    elapsed = time.perf_counter() - start
+
+    print("\nBatch statistics:")
+    print(f"  - Succeeded: {len(latencies)}/{batch} (failed: {errors})")
+    print(f"  - Wall time: {elapsed:.3f}s")
+    if len(latencies) >= 2:
+        # "inclusive" keeps small batches within the observed range instead of extrapolating
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        print(f"  - Latency p50: {percentiles[49]:.3f}s")
+        print(f"  - Latency p95: {percentiles[94]:.3f}s")
+        print(f"  - Latency p99: {percentiles[98]:.3f}s")
+    elif latencies:
+        print(f"  - Latency: {latencies[0]:.3f}s")
+    if completion_tokens:
+        print(f"  - Completion tokens: {completion_tokens}")
+        print(f"  - Throughput: {completion_tokens / elapsed:.1f} tokens/s")
+
+    return errors == 0
+
+
+def positive_int(value: str) -> int:
+    """argparse type for options that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -12,6 +155,7 @@ if __name__ == "__main__":
 Usage examples:
   python scripts/check_deployment_en.py --base-url http://localhost:8000/v1 --apikey your-key --model autoglm-phone-9b
   python scripts/check_deployment_en.py --base-url http://localhost:8000/v1 --apikey your-key --model autoglm-phone-9b --messages-file custom.json
+  python scripts/check_deployment_en.py --base-url http://localhost:8000/v1 --apikey your-key --model autoglm-phone-9b --batch 32 --concurrency 8
         """,
     )
 
@@ -68,15 +212,33 @@ Usage examples:
         help="Frequency penalty parameter (default: 0.2)",
     )
 
+    parser.add_argument(
+        "--batch",
+        type=positive_int,
+        default=1,
+        help="Number of identical requests to send for throughput probing (default: 1)",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="Maximum concurrent requests in batch mode (default: 4)",
+    )
+
     args = parser.parse_args()
 
+    # One pooled connection per worker, otherwise batch runs beyond the default
+    # pool size open and discard a connection per request
+    mount_adapter(max(8, args.concurrency))
+
     # Read test messages
     if not os.path.exists(args.messages_file):
         print(f"Error: Message file {args.messages_file} does not exist")
         exit(1)
 
-    with open(args.messages_file) as f:
-        messages = json.load(f)
+    with open(args.messages_file, "rb") as f:
+        messages = json_loads(f.read())
 
     base_url = args.base_url
     api_key = args.apikey
@@ -104,16 +266,19 @@ Usage examples:
             "stream": False,
         }
 
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        data = response.json()
+        if args.batch > 1:
+            if not run_batch(url, headers, payload, args.batch, args.concurrency):
+                exit(1)
+            exit(0)
 
         print("\nModel inference result:")
         print("=" * 80)
-        print(data["choices"][0]["message"]["content"])
+        start = time.perf_counter()
+        usage = stream_completion(url, headers, payload)
+        elapsed = time.perf_counter() - start
         print("=" * 80)
+        print(f"Total time: {elapsed:.3f}s")
 
-        usage = data.get("usage")
         if usage:
             print(f"\nStatistics:")
             print(f"  - Prompt tokens: {usage.get('prompt_tokens')}")
@@ -34,6 +34,10 @@ setup(
         "requests>=2.31.0",
     ],
     extras_require={
+        "speedups": [
+            "orjson>=3.9.0",
+            "msgspec>=0.18.0",
+        ],
         "dev": [
             "pytest>=7.0.0",
             "black>=23.0.0",
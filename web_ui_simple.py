@@ -1,29 +1,47 @@
 import http.server
-import socketserver
 import threading
 import json
 import os
 import base64
+import gzip
+import hashlib
+import html
+import queue
+import string
 import subprocess
+import time
+from collections import deque
+from email.utils import formatdate
 from urllib.parse import urlparse, parse_qs, unquote
 from io import BytesIO
-from PIL import Image
 from dotenv import load_dotenv
 
-from phone_agent.agent import PhoneAgent, AgentConfig
-from phone_agent.model import ModelConfig
+try:
+    # orjson 直接输出 bytes，序列化 /state、/events 比标准库快得多
+    from orjson import dumps as json_bytes
+except ImportError:
+    def json_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
 
 load_dotenv()
 
 CONFIG_FILE = "ui_config.json"
+SCREENSHOT_FILE = "latest_screenshot.png"
 # 强制本地不走代理
 os.environ["NO_PROXY"] = "localhost,127.0.0.1"
 
+# 最近一次读到或写入的配置文件内容，配置没变时 save_config 不再重写文件
+config_file_cache = {"data": None}
+config_file_lock = threading.Lock()
+
 def load_config():
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(CONFIG_FILE, "rb") as f:
+                data = f.read()
+            config = json.loads(data)
+            config_file_cache["data"] = data
+            return config
         except: pass
     return {
         "api_key": os.getenv("OPENAI_API_KEY", ""),
@@ -36,167 +54,737 @@ def load_config():
     }
 
 def save_config(config):
-    with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2)
+    data = json.dumps(config, indent=2).encode()
+    with config_file_lock:
+        if data == config_file_cache["data"]:
+            return
+        # 先写临时文件再原子替换，写到一半退出也不会留下损坏的配置
+        tmp_path = CONFIG_FILE + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, CONFIG_FILE)
+        config_file_cache["data"] = data
+
+# 最新截图缓存在内存中，/screenshot.png 直接从内存返回，不再每次读磁盘；
+# base64 同时保留，通过 /events 直接推送给页面
+screenshot_lock = threading.Lock()
+latest_screenshot = {"data": b"", "b64": "", "mime": "image/png", "etag": "", "time_ns": 0}
+
+# 截图在这段时间内视为最新，/refresh_screen 直接复用，不再调用 ADB
+SCREENSHOT_TTL_NS = 500_000_000
+# 多个页面同时请求刷新时只截一次图
+refresh_lock = threading.Lock()
+
+def screenshot_is_fresh():
+    with screenshot_lock:
+        return time.monotonic_ns() - latest_screenshot["time_ns"] < SCREENSHOT_TTL_NS
+
+# 页面上的画面最宽只有几百像素，缩小后再发给浏览器
+PREVIEW_SIZE = (640, 1600)
+
+def make_preview(img_data):
+    # PIL 导入较慢，第一次截图时才导入，网页服务启动后可以马上响应 /、/state
+    from PIL import Image
+    img = Image.open(BytesIO(img_data))
+    img.thumbnail(PREVIEW_SIZE, Image.LANCZOS)
+    buf = BytesIO()
+    try:
+        img.save(buf, "WEBP", quality=70, method=4)
+        return buf.getvalue(), "image/webp"
+    except (KeyError, OSError):
+        # Pillow 没有编译 WebP 支持时退回 PNG
+        buf = BytesIO()
+        img.save(buf, "PNG")
+        return buf.getvalue(), "image/png"
+
+def store_screenshot(img_data):
+    # img_data 是原始 PNG 字节，设备层已经提供，无需再做 base64 往返
+    preview, mime = make_preview(img_data)
+    etag = '"' + hashlib.blake2b(preview, digest_size=8).hexdigest() + '"'
+    with screenshot_lock:
+        latest_screenshot["data"] = preview
+        latest_screenshot["b64"] = base64.b64encode(preview).decode()
+        latest_screenshot["mime"] = mime
+        latest_screenshot["etag"] = etag
+        latest_screenshot["time_ns"] = time.monotonic_ns()
+    with state_cv:
+        state_cv.notify_all()
+    # 仍然写入磁盘，方便外部工具查看；先写临时文件再原子替换，
+    # 读取方不会读到写了一半的图片（临时文件按线程区分，手动刷新和 Agent 可能同时写）
+    tmp_path = "%s.%d.tmp" % (SCREENSHOT_FILE, threading.get_ident())
+    with open(tmp_path, "wb") as f:
+        f.write(img_data)
+    os.replace(tmp_path, SCREENSHOT_FILE)
+
+# 运行日志最多保留的步骤数，超出后丢弃最早的
+HISTORY_LIMIT = 200
+
+# 单个任务允许的最大步数，防止客户端传入过大的值让任务一直跑下去
+MAX_STEPS_LIMIT = 200
+
+# /start 请求体的大小上限
+MAX_START_BODY = 64 * 1024
+
+# 推给页面的思考过程最多这么多字，完整内容由 /step?i= 按需获取
+THINKING_PREVIEW = 400
 
 # 全局状态
 state = {
-    "history": [], # 存储步骤对象
+    "history": deque(maxlen=HISTORY_LIMIT), # 存储步骤对象
     "running": False,
     "current_step": 0,
     "current_task": "",
-    "config": load_config()
+    "run_id": 0, # 每次开始新任务加一，/events 据此判断是否需要重发完整日志
+    "config": load_config(),
+    "version": 0 # 每次状态变化加一，/events 据此推送
 }
+# state 由 Agent 线程和各请求线程同时访问，读写都要持有 state_lock；
+# state_cv 与其共用同一把锁，等待和通知不需要额外加锁
+state_lock = threading.Lock()
+state_cv = threading.Condition(state_lock)
+
+def notify_state():
+    # 调用时必须已持有 state_lock
+    state["version"] += 1
+    state_cv.notify_all()
+
+def wire_step(entry):
+    # 日志里保留完整内容，发给页面时只截取思考过程的开头
+    thinking = entry.get("thinking") or ""
+    if len(thinking) <= THINKING_PREVIEW:
+        return entry
+    lean = dict(entry)
+    lean["thinking"] = thinking[:THINKING_PREVIEW]
+    lean["truncated"] = True
+    return lean
+
+def state_snapshot():
+    # 只返回界面需要的状态，不包含巨大的图片数据；调用时必须已持有 state_lock
+    return {
+        "running": state["running"],
+        "history": [wire_step(entry) for entry in state["history"]],
+        "current_step": state["current_step"],
+        "config": state["config"],
+        "current_task": state["current_task"],
+        "run_id": state["run_id"]
+    }
+
+def state_json():
+    with state_lock:
+        return json_bytes(state_snapshot())
+
+def state_event(run_id, last_step):
+    # 同一次任务内只推送 last_step 之后新增的步骤，已发送过的日志不再重复传输；
+    # 首次连接或开始了新任务时才发送完整状态
+    with state_lock:
+        if run_id != state["run_id"]:
+            payload = state_snapshot()
+        else:
+            steps = []
+            for entry in reversed(state["history"]):
+                if entry["step"] <= last_step:
+                    break
+                steps.append(wire_step(entry))
+            steps.reverse()
+            payload = {
+                "running": state["running"],
+                "current_step": state["current_step"],
+                "current_task": state["current_task"],
+                "steps": steps
+            }
+        return json_bytes(payload), state["run_id"], state["current_step"]
+
+# 缓存项是 (config, body, gzip_body, etag) 元组，整体替换，并发的 /start 不会让内容和 ETag 错配
+html_cache = {"entry": (None, b"", b"", "")}
+
+# 压缩后的 /state 按 version 缓存，状态没变时轮询不用重复压缩
+# 缓存项是 (version, body) 元组，整体替换，不会出现新版本号配旧内容
+state_gzip_cache = {"entry": (None, b"")}
+
+def state_json_gzip():
+    # 取快照、压缩、写缓存都在同一段锁内完成，并发的轮询请求不会互相覆盖
+    with state_lock:
+        version, body = state_gzip_cache["entry"]
+        if version != state["version"]:
+            # compresslevel=1 几乎不占 CPU，日志文本仍能压缩到原来的几分之一
+            body = gzip.compress(json_bytes(state_snapshot()), compresslevel=1)
+            state_gzip_cache["entry"] = (state["version"], body)
+        return body
 
 class SimpleHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 让浏览器复用连接，每个响应都必须带 Content-Length
+    protocol_version = "HTTP/1.1"
+    # 为每个连接设置 TCP_NODELAY，/state 这类小响应不会被 Nagle 算法延迟发送
+    disable_nagle_algorithm = True
+
+    def address_string(self):
+        # 日志里只用 IP，不做反向 DNS 解析
+        return self.client_address[0]
+
+    def log_request(self, code='-', size='-'):
+        # 界面每秒都有请求，不逐条打印访问日志；错误仍通过 log_error 输出
+        pass
+
+    def send_head(self, code, length, content_type=None, headers=None):
+        self.send_response(code)
+        if content_type:
+            self.send_header('Content-type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+
+    def send_body(self, code, body=b"", content_type=None, headers=None):
+        self.send_head(code, len(body), content_type, headers)
+        self.wfile.write(body)
+
+    def send_not_modified(self, headers):
+        # 304 按定义没有消息体，只发校验相关的头，不带 Content-Length
+        self.send_response(304)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Connection', 'keep-alive')
+        self.end_headers()
+
+    def send_cached(self, body, gzip_body, etag, content_type, cache_control):
+        # 发送预先压缩好的内容：按 Accept-Encoding 选择版本，ETag 命中时只返回 304
+        headers = {
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip_body
+            # 压缩后的内容是另一份表示，ETag 也要区分开
+            headers['ETag'] = etag[:-1] + '-gzip"'
+            headers['Content-Encoding'] = 'gzip'
+        else:
+            headers['ETag'] = etag
+        if self.headers.get('If-None-Match') == headers['ETag']:
+            headers.pop('Content-Encoding', None)
+            self.send_not_modified(headers)
+            return
+        self.send_body(200, body, content_type, headers)
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
         if parsed_path.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(self.get_html().encode())
+            with state_lock:
+                c = state["config"]
+            # 页面只随 config 变化，/start 会替换 config 对象，其余时候直接复用编码好的页面
+            entry = html_cache["entry"]
+            if entry[0] is not c:
+                body = self.get_html(c).encode()
+                etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+                # 压缩结果和页面一起缓存，请求时不再压缩
+                entry = (c, body, gzip.compress(body, compresslevel=9), etag)
+                html_cache["entry"] = entry
+            _, html_body, html_gzip, html_etag = entry
+            # 页面引用的静态文件地址带内容哈希，重启后可能已经变化，
+            # 所以页面本身每次都要用 ETag 向服务器验证，不能直接用缓存
+            self.send_cached(html_body, html_gzip, html_etag, 'text/html; charset=utf-8', 'no-cache')
             
         elif parsed_path.path == '/state':
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self.send_body(200, state_json_gzip(), 'application/json', {
+                    'Content-Encoding': 'gzip',
+                    'Vary': 'Accept-Encoding'
+                })
+            else:
+                self.send_body(200, state_json(), 'application/json', {'Vary': 'Accept-Encoding'})
+
+        elif parsed_path.path == '/events':
+            # SSE 推送：状态变化时立即发送，空闲时定期发送注释保持连接
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            # 事件流没有 Content-Length，结束时关闭连接
+            self.send_header('Connection', 'close')
             self.end_headers()
-            # 只返回界面需要的状态，不包含巨大的图片数据
-            self.wfile.write(json.dumps({
-                "running": state["running"],
-                "history": state["history"],
-                "config": state["config"],
-                "current_task": state["current_task"]
-            }).encode())
+            version = None
+            shot_etag = None
+            run_id = None
+            last_step = 0
+            try:
+                while True:
+                    with state_cv:
+                        state_cv.wait_for(
+                            lambda: state["version"] != version or latest_screenshot["etag"] != shot_etag,
+                            timeout=30
+                        )
+                        new_version = state["version"]
+                    with screenshot_lock:
+                        new_etag = latest_screenshot["etag"]
+                        shot_b64 = latest_screenshot["b64"]
+                        shot_mime = latest_screenshot["mime"]
+                    frames = []
+                    # 截图以 data URI 内联推送，页面不用再单独请求 /screenshot.png
+                    if new_etag != shot_etag and shot_b64:
+                        frames.append(
+                            b"event: screenshot\ndata: data:" + shot_mime.encode() + b";base64," + shot_b64.encode() + b"\n\n"
+                        )
+                    if new_version != version:
+                        body, run_id, last_step = state_event(run_id, last_step)
+                        frames.append(b"data: " + body + b"\n\n")
+                    version, shot_etag = new_version, new_etag
+                    self.wfile.write(b"".join(frames) or b": keep-alive\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
             
+        elif parsed_path.path in STATIC_FILES:
+            # 地址随内容变化，同一个地址的内容永远不变
+            asset = STATIC_FILES[parsed_path.path]
+            self.send_cached(asset["body"], asset["gzip"], asset["etag"], asset["content_type"],
+                             'public, max-age=31536000, immutable')
+
+        elif parsed_path.path == '/step':
+            # 返回某一步的完整记录，页面点“展开全文”时才请求
+            try:
+                i = int(parse_qs(parsed_path.query).get('i', [''])[0])
+            except ValueError:
+                self.send_body(400)
+                return
+            with state_lock:
+                history = state["history"]
+                # 步骤编号是连续的，可以直接换算成下标
+                idx = i - history[0]["step"] if history else -1
+                entry = history[idx] if 0 <= idx < len(history) else None
+            if entry is None:
+                self.send_body(404)
+            else:
+                self.send_body(200, json_bytes(entry), 'application/json')
+
         elif parsed_path.path == '/screenshot.png':
-            if os.path.exists("latest_screenshot.png"):
-                self.send_response(200)
-                self.send_header('Content-type', 'image/png')
-                self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate, max-age=0')
-                self.end_headers()
-                with open("latest_screenshot.png", "rb") as f:
-                    self.wfile.write(f.read())
+            with screenshot_lock:
+                img_data = latest_screenshot["data"]
+                mime = latest_screenshot["mime"]
+                etag = latest_screenshot["etag"]
+            if img_data:
+                # 画面没有变化时只返回 304，不重复传输图片
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_not_modified({
+                        'Cache-Control': 'no-cache',
+                        'ETag': etag
+                    })
+                    return
+                self.send_body(200, img_data, mime, {
+                    'Cache-Control': 'no-cache',
+                    'ETag': etag
+                })
             else:
-                self.send_response(404)
-                self.end_headers()
+                # 本次启动还没有截图时，返回上次运行留下的文件；
+                # 直接打开而不是先 os.path.exists，省一次 stat，也不会在两步之间被删掉
+                try:
+                    f = open(SCREENSHOT_FILE, "rb")
+                except FileNotFoundError:
+                    self.send_body(404)
+                    return
+                with f:
+                    st = os.fstat(f.fileno())
+                    size = st.st_size
+                    etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_not_modified({
+                            'Cache-Control': 'no-cache',
+                            'ETag': etag,
+                            'Last-Modified': formatdate(st.st_mtime, usegmt=True)
+                        })
+                        return
+                    self.send_head(200, size, 'image/png', {
+                        'Cache-Control': 'no-cache',
+                        'ETag': etag,
+                        'Last-Modified': formatdate(st.st_mtime, usegmt=True)
+                    })
+                    # socket.sendfile 在支持的平台上走 os.sendfile 零拷贝，
+                    # 否则自动退回按块 read/send，不会把整张图读进内存
+                    self.connection.sendfile(f, 0, size)
 
         elif parsed_path.path == '/refresh_screen':
             # 手动触发一次屏幕截图
             try:
-                from phone_agent.device_factory import get_device_factory
-                df = get_device_factory()
-                # 尝试获取当前配置中的 device_id
-                cfg = state["config"]
-                screenshot = df.get_screenshot(cfg.get("device_id") if cfg.get("device_id") else None)
-                if screenshot:
-                    img_data = base64.b64decode(screenshot.base64_data)
-                    with open("latest_screenshot.png", "wb") as f:
-                        f.write(img_data)
-                    self.send_response(200)
-                    self.end_headers()
-                    self.wfile.write(b"OK")
-                else:
-                    self.send_response(500)
-                    self.end_headers()
+                # 排队等锁的请求拿到锁时，前一个请求刚截的图已经是新的，直接返回
+                with refresh_lock:
+                    if not screenshot_is_fresh():
+                        from phone_agent.device_factory import get_device_factory
+                        df = get_device_factory()
+                        # 尝试获取当前配置中的 device_id
+                        with state_lock:
+                            cfg = state["config"]
+                        screenshot = df.get_screenshot(cfg.get("device_id") if cfg.get("device_id") else None)
+                        if not screenshot:
+                            self.send_body(500)
+                            return
+                        store_screenshot(screenshot.raw_bytes or base64.b64decode(screenshot.base64_data))
+                self.send_body(200, b"OK")
             except Exception as e:
-                self.send_response(500)
-                self.end_headers()
-                self.wfile.write(str(e).encode())
+                self.send_body(500, str(e).encode())
 
-        elif parsed_path.path == '/start':
-            query = parse_qs(parsed_path.query)
+        else:
+            self.send_body(404)
+
+    def do_POST(self):
+        parsed_path = urlparse(self.path)
+        if parsed_path.path == '/start':
+            # 配置和任务放在 JSON 请求体里，API Key 不会出现在 URL 和日志中
+            try:
+                length = int(self.headers.get('Content-Length', ''))
+            except ValueError:
+                self.send_body(411)
+                return
+            if not 0 <= length <= MAX_START_BODY:
+                self.send_body(413)
+                return
+            try:
+                body = json.loads(self.rfile.read(length))
+                max_steps = min(max(1, int(body.get('max_steps', 15))), MAX_STEPS_LIMIT)
+            except (ValueError, TypeError, AttributeError):
+                self.send_body(400)
+                return
             # 更新并保存配置
             new_config = {
-                "api_key": query.get('api_key', [''])[0],
-                "base_url": query.get('base_url', [''])[0],
-                "model_name": query.get('model_name', [''])[0],
-                "api_type": query.get('api_type', ['openai'])[0],
-                "device_id": query.get('device_id', [''])[0],
-                "lang": query.get('lang', ['cn'])[0],
-                "max_steps": int(query.get('max_steps', [15])[0])
+                "api_key": str(body.get('api_key') or ''),
+                "base_url": str(body.get('base_url') or ''),
+                "model_name": str(body.get('model_name') or ''),
+                "api_type": str(body.get('api_type') or 'openai'),
+                "device_id": str(body.get('device_id') or ''),
+                "lang": str(body.get('lang') or 'cn'),
+                "max_steps": max_steps
             }
-            state["config"] = new_config
+            with state_lock:
+                state["config"] = new_config
+                running = state['running']
+                notify_state()
             save_config(new_config)
-            
-            task = query.get('task', [''])[0]
-            if task and not state['running']:
+
+            task = str(body.get('task') or '')
+            if task and not running:
                 # 设置为 daemon=True，确保主程序退出时子线程也随之停止
                 t = threading.Thread(target=run_agent_thread, args=(task, new_config))
                 t.daemon = True
                 t.start()
-            
-            self.send_response(200)
-            self.end_headers()
-            self.wfile.write(b"OK")
 
-    def get_html(self):
-        c = state["config"]
-        # 使用三个单引号的 f-string 以减少双引号转义压力，但这里保持一致
-        return f"""
+            self.send_body(200, b"OK")
+
+        else:
+            self.send_body(404)
+
+    def get_html(self, c):
+        # 配置值会写进 HTML 属性，必须转义，否则值里的引号会破坏页面
+        return HTML_SHELL_TEMPLATE.substitute(
+            api_key=html.escape(c['api_key']),
+            base_url=html.escape(c['base_url']),
+            model_name=html.escape(c['model_name']),
+            openai_selected="selected" if c['api_type'] == 'openai' else "",
+            gemini_selected="selected" if c['api_type'] == 'gemini' else "",
+            device_id=html.escape(c['device_id']),
+            max_steps=int(c['max_steps'])
+        )
+
+# 样式和脚本作为单独的静态文件提供，地址里带内容哈希，浏览器可以永久缓存
+APP_CSS = """
+:root {
+    --primary: #10a37f;
+    --primary-hover: #0d8a6a;
+    --bg-page: #f0f2f5;
+    --bg-card: #ffffff;
+    --text-main: #1a1a1a;
+    --text-muted: #666666;
+    --border: #e0e0e0;
+    --sidebar-bg: #202123;
+}
+body { font-family: 'Inter', -apple-system, system-ui, sans-serif; margin: 0; background: var(--bg-page); color: var(--text-main); line-height: 1.5; }
+.app { display: flex; flex-direction: column; height: 100vh; }
+header { background: var(--sidebar-bg); color: white; padding: 0 24px; height: 60px; display: flex; justify-content: space-between; align-items: center; box-shadow: 0 2px 4px rgba(0,0,0,0.1); z-index: 10; }
+.header-title { font-size: 18px; font-weight: 700; display: flex; align-items: center; gap: 10px; }
+.main { display: flex; flex: 1; overflow: hidden; }
+.sidebar { width: 320px; background: var(--bg-card); border-right: 1px solid var(--border); padding: 24px; overflow-y: auto; flex-shrink: 0; display: flex; flex-direction: column; gap: 20px; }
+.sidebar h3 { margin: 0 0 10px 0; font-size: 16px; display: flex; align-items: center; gap: 8px; color: var(--text-main); }
+.field { margin-bottom: 0; }
+.field label { display: block; margin-bottom: 6px; font-size: 12px; font-weight: 600; color: var(--text-muted); text-transform: uppercase; }
+.field input, .field select { width: 100%; padding: 10px 12px; border: 1px solid var(--border); border-radius: 8px; box-sizing: border-box; font-size: 14px; transition: border-color 0.2s; }
+.field input:focus { outline: none; border-color: var(--primary); }
+.content { flex: 1; display: flex; flex-direction: column; padding: 24px; overflow-y: auto; gap: 24px; min-width: 0; }
+.card { background: var(--bg-card); border-radius: 12px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); border: 1px solid var(--border); max-width: 100%; overflow: hidden; }
+.task-card { padding: 20px; }
+.task-row { display: flex; gap: 12px; flex-wrap: wrap; }
+.task-row input { flex: 1; min-width: 200px; padding: 12px 16px; border: 1px solid var(--border); border-radius: 10px; font-size: 15px; background: #f9f9f9; }
+.btn-run { background: var(--primary); color: white; border: none; padding: 12px 24px; border-radius: 10px; cursor: pointer; font-weight: 600; font-size: 15px; transition: all 0.2s; display: flex; align-items: center; justify-content: center; gap: 8px; white-space: nowrap; }
+.output-grid { display: grid; grid-template-columns: 380px 1fr; gap: 24px; flex: 1; min-height: 0; min-width: 0; }
+.screen-box { display: flex; flex-direction: column; height: 100%; }
+.box-header { padding: 12px 16px; border-bottom: 1px solid var(--border); font-weight: 600; display: flex; align-items: center; gap: 8px; }
+.screen-container { flex: 1; padding: 16px; display: flex; align-items: center; justify-content: center; background: #2a2a2e; border-bottom-left-radius: 12px; border-bottom-right-radius: 12px; overflow: hidden; }
+#screenshot { max-width: 100%; max-height: 100%; object-fit: contain; border-radius: 4px; box-shadow: 0 4px 12px rgba(0,0,0,0.5); }
+.log-box {display: flex; flex-direction: column; height: 100%; overflow: hidden; }
+#history_list { flex: 1; overflow-y: auto; padding: 0; }
+.step-item { border-bottom: 1px solid var(--border); padding: 20px; transition: background 0.2s; }
+.step-item:last-child { border-bottom: none; }
+.step-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 12px; }
+.step-num { background: #e7f6f2; color: var(--primary); padding: 4px 10px; border-radius: 20px; font-size: 12px; font-weight: 700; }
+.step-status { font-size: 12px; }
+.status-success { color: var(--primary); }
+.status-fail { color: #dc3545; }
+.thought-container { background: #f8f9fa; border-left: 4px solid #dee2e6; padding: 12px 16px; margin-bottom: 12px; border-radius: 0 8px 8px 0; }
+.thought-label { font-size: 11px; font-weight: 700; color: var(--text-muted); text-transform: uppercase; margin-bottom: 4px; display: block; }
+.thought-text { font-size: 14px; color: #444; }
+.action-info { display: flex; align-items: flex-start; gap: 10px; font-size: 14px; overflow: hidden; }
+.action-tag { background: #e7f3ff; color: #007bff; padding: 4px 10px; border-radius: 6px; font-family: 'JetBrains Mono', monospace; font-weight: 600; font-size: 13px; white-space: nowrap; }
+.action-msg { color: var(--text-muted); margin-top: 4px; word-break: break-all; }
+#status-badge { font-size: 13px; display: flex; align-items: center; gap: 6px; font-weight: 600; padding: 6px 12px; border-radius: 20px; background: rgba(255,255,255,0.1); white-space: nowrap; }
+.current-task-display { margin-bottom: 24px; padding: 16px; background: #e7f6f2; border-radius: 10px; border: 1px solid #c3e6cb; word-break: break-all; }
+.task-label { font-size: 12px; font-weight: 700; color: #0d8a6a; margin-bottom: 4px; text-transform: uppercase; }
+.task-text { font-size: 16px; font-weight: 600; color: #155724; }
+@media (max-width: 1024px) { .output-grid { grid-template-columns: 1fr; } .sidebar { width: 280px; } }
+@media (max-width: 768px) { header { padding: 0 16px; } .header-title { font-size: 16px; } .content { padding: 16px; } .main { flex-direction: column; overflow-y: auto; } .sidebar { width: 100%; border-right: none; border-bottom: 1px solid var(--border); height: auto; overflow-y: visible; padding: 16px; box-sizing: border-box; } .app { height: auto; min-height: 100vh; } .main { overflow: visible; } .output-grid { grid-template-columns: 1fr; } .task-row { flex-direction: column; } .btn-run { width: 100%; padding: 12px; } .screen-container { min-height: 400px; } }
+::-webkit-scrollbar { width: 8px; } ::-webkit-scrollbar-track { background: transparent; } ::-webkit-scrollbar-thumb { background: #ccc; border-radius: 4px; } ::-webkit-scrollbar-thumb:hover { background: #bbb; }
+"""
+
+APP_JS = """
+let lastStep = 0;
+// 日志上限由页面传入，与服务器端的 HISTORY_LIMIT 保持一致
+const historyLimit = Number(document.getElementById('history_list').dataset.limit);
+let lastRunId = null;
+let lastStatus = null; // 修改为 null 以确保第一次 update 时强制刷新画面
+
+// 页面加载时自动从 localStorage 恢复设置
+window.addEventListener('DOMContentLoaded', () => {
+    const fields = ['api_key', 'base_url', 'model_name', 'api_type', 'device_id', 'max_steps'];
+    fields.forEach(id => {
+        const saved = localStorage.getItem('autoglm_' + id);
+        if (saved) {
+            document.getElementById(id).value = saved;
+        }
+
+        // 监听输入，实时保存到缓存
+        document.getElementById(id).addEventListener('input', (e) => {
+            localStorage.setItem('autoglm_' + id, e.target.value);
+        });
+    });
+
+    // 加载后立即尝试同步一次手机屏幕
+    fetch('/refresh_screen').then(reloadScreenshot);
+});
+
+// 有 SSE 时截图随事件流推送，只有轮询模式才需要重新请求图片；
+// 用 no-cache 向服务器验证 ETag，画面没变时只返回 304
+let lastShotEtag = null;
+function reloadScreenshot() {
+    if (window.EventSource) return;
+    fetch('/screenshot.png', { cache: 'no-cache' }).then(r => {
+        const etag = r.headers.get('ETag');
+        if (!r.ok || (etag && etag === lastShotEtag)) return null;
+        lastShotEtag = etag;
+        return r.blob();
+    }).then(blob => {
+        if (!blob) return;
+        const img = document.getElementById('screenshot');
+        if (img.src.startsWith('blob:')) URL.revokeObjectURL(img.src);
+        img.src = URL.createObjectURL(blob);
+    }).catch(e => console.error(e));
+}
+
+function refreshScreen() {
+    fetch('/refresh_screen').then(reloadScreenshot);
+}
+
+function startTask() {
+    const task = document.getElementById('task_input').value;
+    if (!task) return alert('请输入任务指令');
+
+    // 启动前先刷新一次屏幕，确保画面是最新的
+    refreshScreen();
+
+    const payload = {
+        task: task,
+        api_key: document.getElementById('api_key').value,
+        base_url: document.getElementById('base_url').value,
+        model_name: document.getElementById('model_name').value,
+        api_type: document.getElementById('api_type').value,
+        device_id: document.getElementById('device_id').value,
+        max_steps: Number(document.getElementById('max_steps').value) || 15,
+        lang: 'cn'
+    };
+
+    fetch('/start', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    }).then(() => pollSoon(500));
+    document.getElementById('current_task_box').style.display = 'block';
+    document.getElementById('display_task_text').innerText = task;
+    document.getElementById('history_list').innerHTML = '<div style="text-align:center;padding:30px;"><i class="fas fa-spinner fa-spin"></i> 初始化中...</div>';
+}
+
+function render(data) {
+    const btn = document.getElementById('run_btn');
+    if (btn.disabled !== data.running) {
+        btn.disabled = data.running;
+        document.getElementById('status-text').innerText = data.running ? "正在运行" : "准备就绪";
+        document.getElementById('status-dot').style.color = data.running ? "#f39c12" : "#10a37f";
+    }
+    if (data.current_task) {
+        document.getElementById('current_task_box').style.display = 'block';
+        document.getElementById('display_task_text').innerText = data.current_task;
+    }
+    if (data.running || lastStatus !== data.running) {
+        reloadScreenshot();
+    }
+    lastStatus = data.running;
+    // 新任务开始时清空日志；之后只把新增的步骤插到最前面，已有节点不再重建
+    const list = document.getElementById('history_list');
+    if (data.run_id !== undefined && data.run_id !== lastRunId) {
+        if (list.querySelector('.step-item')) list.innerHTML = '';
+        lastRunId = data.run_id;
+        lastStep = 0;
+    }
+    const steps = data.steps || data.history || [];
+    steps.forEach(step => {
+        if (step.step <= lastStep) return;
+        // 第一次插入时去掉“等待任务开始”之类的占位内容
+        if (!list.querySelector('.step-item')) list.innerHTML = '';
+        list.prepend(renderStep(step));
+        lastStep = step.step;
+    });
+    // 与服务器端的日志上限保持一致
+    while (list.childElementCount > historyLimit) list.lastElementChild.remove();
+}
+
+// 步骤节点从 <template> 克隆，内容一律用 textContent 填入，
+// 模型输出里的 HTML 不会被当作标签解析
+const stepTpl = document.getElementById('step-tpl');
+function renderStep(step) {
+    const node = stepTpl.content.cloneNode(true);
+    const slot = name => node.querySelector(`[data-slot="${name}"]`);
+    // 有值时填入文字，没有值时去掉整块
+    const fill = (block, name, value) => {
+        if (value) slot(name).textContent = value;
+        else slot(block).remove();
+    };
+    const action = step.action || {};
+    const isSuccess = step.success !== false;
+    const actionName = action.action ? action.action : (action._metadata === 'finish' ? 'Finish' : 'None');
+    const point = action.point || action.start;
+
+    slot('step').textContent = step.step;
+    const status = slot('status');
+    status.classList.add(isSuccess ? 'status-success' : 'status-fail');
+    status.querySelector('i').classList.add(isSuccess ? 'fa-check-circle' : 'fa-exclamation-circle');
+    slot('status-text').textContent = isSuccess ? '成功' : '失败';
+
+    fill('thought', 'thinking', step.thinking);
+    const expand = slot('expand');
+    if (step.truncated) expand.onclick = () => { loadStep(step.step, expand); return false; };
+    else if (expand) expand.remove();
+
+    const tag = slot('action');
+    tag.textContent = actionName;
+    if (actionName === 'Finish') tag.style.cssText = 'background:#10a37f;color:white;';
+    fill('action-thought', 'action-thought-text', action.thought);
+    fill('text', 'text-value', action.text);
+    fill('point', 'point-value', point ? `${point[0]}, ${point[1]}` : '');
+    fill('message', 'message-text', step.message);
+    return node;
+}
+
+function loadStep(i, link) {
+    fetch('/step?i=' + i).then(r => r.json()).then(step => {
+        link.previousElementSibling.textContent = step.thinking;
+        link.remove();
+    }).catch(e => console.error(e));
+}
+
+// 轮询模式下空闲时逐渐放慢，任务运行时恢复 2 秒一次
+let pollPeriod = 2000;
+let idlePolls = 0;
+let pollTimer = null;
+
+function update() {
+    fetch('/state').then(r => r.json()).then(data => {
+        render(data);
+        idlePolls = data.running ? 0 : idlePolls + 1;
+        pollPeriod = idlePolls > 10 ? 10000 : idlePolls > 3 ? 5000 : 2000;
+    }).catch(e => console.error(e));
+}
+
+function poll() {
+    // 页面在后台时不请求，等回到前台再说
+    if (document.visibilityState === 'visible') update();
+    pollTimer = setTimeout(poll, pollPeriod);
+}
+
+// 立即安排一次轮询，用于点击开始任务和页面回到前台
+function pollSoon(delay) {
+    if (pollTimer === null) return;
+    clearTimeout(pollTimer);
+    idlePolls = 0;
+    pollPeriod = 2000;
+    pollTimer = setTimeout(poll, delay);
+}
+
+let events = null;
+function connectEvents() {
+    events = new EventSource('/events');
+    events.onmessage = e => render(JSON.parse(e.data));
+    events.addEventListener('screenshot', e => {
+        document.getElementById('screenshot').src = e.data;
+    });
+}
+
+// 通过 SSE 接收状态推送，只在状态变化时更新；浏览器不支持时退回轮询
+if (window.EventSource) {
+    // 页面在后台时断开事件流，服务器不用再推送截图；回到前台时重新连接，
+    // 第一条消息就是完整状态，已经显示的步骤不会重复添加
+    document.addEventListener('visibilitychange', () => {
+        if (document.hidden) {
+            if (events) events.close();
+            events = null;
+        } else if (!events) {
+            connectEvents();
+        }
+    });
+    if (!document.hidden) connectEvents();
+} else {
+    document.addEventListener('visibilitychange', () => {
+        if (!document.hidden) pollSoon(0);
+    });
+    poll();
+}
+"""
+
+def static_asset(name, ext, text, content_type):
+    body = text.encode()
+    digest = hashlib.blake2b(body, digest_size=6).hexdigest()
+    url = "/static/%s.%s.%s" % (name, digest, ext)
+    return url, {
+        "body": body,
+        "gzip": gzip.compress(body, compresslevel=9),
+        "content_type": content_type,
+        "etag": '"' + digest + '"'
+    }
+
+APP_CSS_URL, _css_asset = static_asset("app", "css", APP_CSS, "text/css; charset=utf-8")
+APP_JS_URL, _js_asset = static_asset("app", "js", APP_JS, "application/javascript; charset=utf-8")
+STATIC_FILES = {APP_CSS_URL: _css_asset, APP_JS_URL: _js_asset}
+
+# 页面外壳在导入时构建一次，渲染时只填入表单里的几个配置值
+HTML_SHELL_TEMPLATE = """
         <!DOCTYPE html>
         <html>
         <head>
             <meta charset="utf-8">
             <meta name="viewport" content="width=device-width, initial-scale=1">
             <title>Open-AutoGLM Web Console</title>
-            <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-            <style>
-                :root {{
-                    --primary: #10a37f;
-                    --primary-hover: #0d8a6a;
-                    --bg-page: #f0f2f5;
-                    --bg-card: #ffffff;
-                    --text-main: #1a1a1a;
-                    --text-muted: #666666;
-                    --border: #e0e0e0;
-                    --sidebar-bg: #202123;
-                }}
-                body {{ font-family: 'Inter', -apple-system, system-ui, sans-serif; margin: 0; background: var(--bg-page); color: var(--text-main); line-height: 1.5; }}
-                .app {{ display: flex; flex-direction: column; height: 100vh; }}
-                header {{ background: var(--sidebar-bg); color: white; padding: 0 24px; height: 60px; display: flex; justify-content: space-between; align-items: center; box-shadow: 0 2px 4px rgba(0,0,0,0.1); z-index: 10; }}
-                .header-title {{ font-size: 18px; font-weight: 700; display: flex; align-items: center; gap: 10px; }}
-                .main {{ display: flex; flex: 1; overflow: hidden; }}
-                .sidebar {{ width: 320px; background: var(--bg-card); border-right: 1px solid var(--border); padding: 24px; overflow-y: auto; flex-shrink: 0; display: flex; flex-direction: column; gap: 20px; }}
-                .sidebar h3 {{ margin: 0 0 10px 0; font-size: 16px; display: flex; align-items: center; gap: 8px; color: var(--text-main); }}
-                .field {{ margin-bottom: 0; }}
-                .field label {{ display: block; margin-bottom: 6px; font-size: 12px; font-weight: 600; color: var(--text-muted); text-transform: uppercase; }}
-                .field input, .field select {{ width: 100%; padding: 10px 12px; border: 1px solid var(--border); border-radius: 8px; box-sizing: border-box; font-size: 14px; transition: border-color 0.2s; }}
-                .field input:focus {{ outline: none; border-color: var(--primary); }}
-                .content {{ flex: 1; display: flex; flex-direction: column; padding: 24px; overflow-y: auto; gap: 24px; min-width: 0; }}
-                .card {{ background: var(--bg-card); border-radius: 12px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); border: 1px solid var(--border); max-width: 100%; overflow: hidden; }}
-                .task-card {{ padding: 20px; }}
-                .task-row {{ display: flex; gap: 12px; flex-wrap: wrap; }}
-                .task-row input {{ flex: 1; min-width: 200px; padding: 12px 16px; border: 1px solid var(--border); border-radius: 10px; font-size: 15px; background: #f9f9f9; }}
-                .btn-run {{ background: var(--primary); color: white; border: none; padding: 12px 24px; border-radius: 10px; cursor: pointer; font-weight: 600; font-size: 15px; transition: all 0.2s; display: flex; align-items: center; justify-content: center; gap: 8px; white-space: nowrap; }}
-                .output-grid {{ display: grid; grid-template-columns: 380px 1fr; gap: 24px; flex: 1; min-height: 0; min-width: 0; }}
-                .screen-box {{ display: flex; flex-direction: column; height: 100%; }}
-                .box-header {{ padding: 12px 16px; border-bottom: 1px solid var(--border); font-weight: 600; display: flex; align-items: center; gap: 8px; }}
-                .screen-container {{ flex: 1; padding: 16px; display: flex; align-items: center; justify-content: center; background: #2a2a2e; border-bottom-left-radius: 12px; border-bottom-right-radius: 12px; overflow: hidden; }}
-                #screenshot {{ max-width: 100%; max-height: 100%; object-fit: contain; border-radius: 4px; box-shadow: 0 4px 12px rgba(0,0,0,0.5); }}
-                .log-box {{display: flex; flex-direction: column; height: 100%; overflow: hidden; }}
-                #history_list {{ flex: 1; overflow-y: auto; padding: 0; }}
-                .step-item {{ border-bottom: 1px solid var(--border); padding: 20px; transition: background 0.2s; }}
-                .step-item:last-child {{ border-bottom: none; }}
-                .step-header {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 12px; }}
-                .step-num {{ background: #e7f6f2; color: var(--primary); padding: 4px 10px; border-radius: 20px; font-size: 12px; font-weight: 700; }}
-                .step-status {{ font-size: 12px; }}
-                .status-success {{ color: var(--primary); }}
-                .status-fail {{ color: #dc3545; }}
-                .thought-container {{ background: #f8f9fa; border-left: 4px solid #dee2e6; padding: 12px 16px; margin-bottom: 12px; border-radius: 0 8px 8px 0; }}
-                .thought-label {{ font-size: 11px; font-weight: 700; color: var(--text-muted); text-transform: uppercase; margin-bottom: 4px; display: block; }}
-                .thought-text {{ font-size: 14px; color: #444; }}
-                .action-info {{ display: flex; align-items: flex-start; gap: 10px; font-size: 14px; overflow: hidden; }}
-                .action-tag {{ background: #e7f3ff; color: #007bff; padding: 4px 10px; border-radius: 6px; font-family: 'JetBrains Mono', monospace; font-weight: 600; font-size: 13px; white-space: nowrap; }}
-                .action-msg {{ color: var(--text-muted); margin-top: 4px; word-break: break-all; }}
-                #status-badge {{ font-size: 13px; display: flex; align-items: center; gap: 6px; font-weight: 600; padding: 6px 12px; border-radius: 20px; background: rgba(255,255,255,0.1); white-space: nowrap; }}
-                .current-task-display {{ margin-bottom: 24px; padding: 16px; background: #e7f6f2; border-radius: 10px; border: 1px solid #c3e6cb; word-break: break-all; }}
-                .task-label {{ font-size: 12px; font-weight: 700; color: #0d8a6a; margin-bottom: 4px; text-transform: uppercase; }}
-                .task-text {{ font-size: 16px; font-weight: 600; color: #155724; }}
-                @media (max-width: 1024px) {{ .output-grid {{ grid-template-columns: 1fr; }} .sidebar {{ width: 280px; }} }}
-                @media (max-width: 768px) {{ header {{ padding: 0 16px; }} .header-title {{ font-size: 16px; }} .content {{ padding: 16px; }} .main {{ flex-direction: column; overflow-y: auto; }} .sidebar {{ width: 100%; border-right: none; border-bottom: 1px solid var(--border); height: auto; overflow-y: visible; padding: 16px; box-sizing: border-box; }} .app {{ height: auto; min-height: 100vh; }} .main {{ overflow: visible; }} .output-grid {{ grid-template-columns: 1fr; }} .task-row {{ flex-direction: column; }} .btn-run {{ width: 100%; padding: 12px; }} .screen-container {{ min-height: 400px; }} }}
-                ::-webkit-scrollbar {{ width: 8px; }} ::-webkit-scrollbar-track {{ background: transparent; }} ::-webkit-scrollbar-thumb {{ background: #ccc; border-radius: 4px; }} ::-webkit-scrollbar-thumb:hover {{ background: #bbb; }}
-            </style>
+            <!-- 图标只用到 solid 样式，只加载核心和 solid 两个样式表（不含 brands/regular 字体）；
+                 异步加载，CDN 慢时不阻塞首屏渲染 -->
+            <link rel="dns-prefetch" href="//cdnjs.cloudflare.com">
+            <link rel="preconnect" href="https://cdnjs.cloudflare.com" crossorigin>
+            <link rel="preload" as="style" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/fontawesome.min.css" onload="this.onload=null;this.rel='stylesheet'">
+            <link rel="preload" as="style" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/solid.min.css" onload="this.onload=null;this.rel='stylesheet'">
+            <noscript>
+                <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/fontawesome.min.css">
+                <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/solid.min.css">
+            </noscript>
+            <link rel="stylesheet" href="${css_url}">
         </head>
         <body>
             <div class="app">
@@ -208,15 +796,15 @@ class SimpleHandler(http.server.SimpleHTTPRequestHandler):
                     <div class="sidebar">
                         <div>
                             <h3><i class="fas fa-cog"></i> 模型设置</h3>
-                            <div class="field"><label>API Key</label><input type="password" id="api_key" value="{c['api_key']}" placeholder="sk-..."></div>
-                            <div style="margin-top: 12px;" class="field"><label>Base URL</label><input type="text" id="base_url" value="{c['base_url']}"></div>
-                            <div style="margin-top: 12px;" class="field"><label>Model Name</label><input type="text" id="model_name" value="{c['model_name']}"></div>
-                            <div style="margin-top: 12px;" class="field"><label>API Type</label><select id="api_type"><option value="openai" {"selected" if c['api_type']=='openai' else ""}>OpenAI</option><option value="gemini" {"selected" if c['api_type']=='gemini' else ""}>Gemini</option></select></div>
+                            <div class="field"><label>API Key</label><input type="password" id="api_key" value="${api_key}" placeholder="sk-..."></div>
+                            <div style="margin-top: 12px;" class="field"><label>Base URL</label><input type="text" id="base_url" value="${base_url}"></div>
+                            <div style="margin-top: 12px;" class="field"><label>Model Name</label><input type="text" id="model_name" value="${model_name}"></div>
+                            <div style="margin-top: 12px;" class="field"><label>API Type</label><select id="api_type"><option value="openai" ${openai_selected}>OpenAI</option><option value="gemini" ${gemini_selected}>Gemini</option></select></div>
                         </div>
                         <div style="margin-top: 10px; padding-top: 20px; border-top: 1px solid var(--border);">
                             <h3><i class="fas fa-mobile-alt"></i> 设备设置</h3>
-                            <div class="field"><label>Device ID</label><input type="text" id="device_id" value="{c['device_id']}" placeholder="ADB Serial (可选)"></div>
-                            <div style="margin-top: 12px;" class="field"><label>最大步数</label><input type="number" id="max_steps" value="{c['max_steps']}"></div>
+                            <div class="field"><label>Device ID</label><input type="text" id="device_id" value="${device_id}" placeholder="ADB Serial (可选)"></div>
+                            <div style="margin-top: 12px;" class="field"><label>最大步数</label><input type="number" id="max_steps" min="1" max="${max_steps_limit}" value="${max_steps}"></div>
                         </div>
                         <div style="flex:1"></div>
                         <div style="font-size: 11px; color: var(--text-muted); text-align: center; padding: 10px;">Powered by Open-AutoGLM</div>
@@ -226,145 +814,69 @@ class SimpleHandler(http.server.SimpleHTTPRequestHandler):
                         <div id="current_task_box" class="current-task-display" style="display: none;"><div class="task-label">正在执行任务</div><div id="display_task_text" class="task-text"></div></div>
                         <div class="output-grid">
                             <div class="card screen-box"><div class="box-header"><i class="fas fa-desktop"></i> 实时画面</div><div class="screen-container"><img id="screenshot" src="/screenshot.png"></div></div>
-                            <div class="card log-box"><div class="box-header"><i class="fas fa-list-ul"></i> 运行日志</div><div id="history_list"><div style="padding: 40px; text-align: center; color: var(--text-muted);"><i class="fas fa-terminal" style="font-size: 48px; margin-bottom: 16px; opacity: 0.2;"></i><p>等待任务开始...</p></div></div></div>
+                            <div class="card log-box"><div class="box-header"><i class="fas fa-list-ul"></i> 运行日志</div><div id="history_list" data-limit="${history_limit}"><div style="padding: 40px; text-align: center; color: var(--text-muted);"><i class="fas fa-terminal" style="font-size: 48px; margin-bottom: 16px; opacity: 0.2;"></i><p>等待任务开始...</p></div></div></div>
                         </div>
                     </div>
                 </div>
             </div>
 
-            <script>
-                let lastHistoryLen = 0;
-                let lastStatus = null; // 修改为 null 以确保第一次 update 时强制刷新画面
-
-                // 页面加载时自动从 localStorage 恢复设置
-                window.addEventListener('DOMContentLoaded', () => {{
-                    const fields = ['api_key', 'base_url', 'model_name', 'api_type', 'device_id', 'max_steps'];
-                    fields.forEach(id => {{
-                        const saved = localStorage.getItem('autoglm_' + id);
-                        if (saved) {{
-                            document.getElementById(id).value = saved;
-                        }}
-                        
-                        // 监听输入，实时保存到缓存
-                        document.getElementById(id).addEventListener('input', (e) => {{
-                            localStorage.setItem('autoglm_' + id, e.target.value);
-                        }});
-                    }});
-                    
-                    // 加载后立即尝试同步一次手机屏幕
-                    fetch('/refresh_screen').then(() => {{
-                        document.getElementById('screenshot').src = "/screenshot.png?t=" + Date.now();
-                    }});
-                }});
-
-                function refreshScreen() {{
-                    fetch('/refresh_screen').then(() => {{
-                        document.getElementById('screenshot').src = "/screenshot.png?t=" + Date.now();
-                    }});
-                }}
-
-                function startTask() {{
-                    const task = document.getElementById('task_input').value;
-                    if (!task) return alert('请输入任务指令');
-                    
-                    // 启动前先刷新一次屏幕，确保画面是最新的
-                    refreshScreen();
-                    
-                    const params = new URLSearchParams({{
-                        task: task,
-                        api_key: document.getElementById('api_key').value,
-                        base_url: document.getElementById('base_url').value,
-                        model_name: document.getElementById('model_name').value,
-                        api_type: document.getElementById('api_type').value,
-                        device_id: document.getElementById('device_id').value,
-                        max_steps: document.getElementById('max_steps').value,
-                        lang: 'cn'
-                    }});
-                    
-                    fetch('/start?' + params.toString());
-                    document.getElementById('current_task_box').style.display = 'block';
-                    document.getElementById('display_task_text').innerText = task;
-                    document.getElementById('history_list').innerHTML = '<div style="text-align:center;padding:30px;"><i class="fas fa-spinner fa-spin"></i> 初始化中...</div>';
-                    lastHistoryLen = 0;
-                }}
-
-                function update() {{
-                    fetch('/state').then(r => r.json()).then(data => {{
-                        const btn = document.getElementById('run_btn');
-                        if (btn.disabled !== data.running) {{
-                            btn.disabled = data.running;
-                            document.getElementById('status-text').innerText = data.running ? "正在运行" : "准备就绪";
-                            document.getElementById('status-dot').style.color = data.running ? "#f39c12" : "#10a37f";
-                        }}
-                        if (data.current_task) {{
-                            document.getElementById('current_task_box').style.display = 'block';
-                            document.getElementById('display_task_text').innerText = data.current_task;
-                        }}
-                        if (data.running || lastStatus !== data.running) {{
-                            document.getElementById('screenshot').src = "/screenshot.png?t=" + Date.now();
-                        }}
-                        lastStatus = data.running;
-                        if (data.history.length !== lastHistoryLen) {{
-                            let html = "";
-                            const history = [...data.history].reverse();
-                            history.forEach((step, idx) => {{
-                                const stepIdx = data.history.length - idx;
-                                const isSuccess = step.success !== false;
-                                const thinking = step.thinking || "";
-                                const actionName = (step.action && step.action.action) ? step.action.action : (step.action && step.action._metadata === 'finish' ? 'Finish' : 'None');
-                                const actionThought = (step.action && step.action.thought) ? step.action.thought : "";
-                                
-                                html += `
-                                    <div class="step-item">
-                                        <div class="step-header">
-                                            <span class="step-num">STEP ${{stepIdx}}</span>
-                                            <span class="step-status ${{isSuccess ? 'status-success' : 'status-fail'}}">
-                                                <i class="fas ${{isSuccess ? 'fa-check-circle' : 'fa-exclamation-circle'}}"></i>
-                                                ${{isSuccess ? '成功' : '失败'}}
-                                            </span>
-                                        </div>
-                                        
-                                        ${{thinking ? `
-                                        <div class="thought-container">
-                                            <div class="thought-text">${{thinking}}</div>
-                                        </div>` : ""}}
-
-                                        <div class="action-info">
-                                            <div style="width: 100%;">
-                                                <div style="display:flex; align-items:center; gap:8px; margin-bottom: 4px;">
-                                                    <span class="action-tag" style="${{actionName === 'Finish' ? 'background:#10a37f;color:white;' : ''}}">${{actionName}}</span>
-                                                    ${{actionThought ? `<span style="color: #10a37f; font-weight: 500; font-size: 13px;"><i class="fas fa-comment-dots"></i> ${{actionThought}}</span>` : ""}}
-                                                </div>
-                                                
-                                                <div style="font-size: 12px; color: #666; margin-left: 2px;">
-                                                    ${{step.action && step.action.text ? `<span><i class="fas fa-keyboard"></i> 内容: "${{step.action.text}}"</span>` : ""}}
-                                                    ${{step.action && (step.action.point || step.action.start) ? `<span style="margin-left:8px;"><i class="fas fa-mouse-pointer"></i> 坐标: [${{ (step.action.point || step.action.start)[0] }}, ${{ (step.action.point || step.action.start)[1] }}]</span>` : ""}}
-                                                </div>
-
-                                                ${{step.message ? `<div class="action-msg" style="margin-top: 8px; padding: 8px; background: #f0f7ff; border-radius: 6px; color: #0056b3;">
-                                                    <i class="fas fa-info-circle"></i> ${{step.message}}
-                                                </div>` : ""}}
-                                            </div>
-                                        </div>
-                                    </div>`;
-                            }});
-                            document.getElementById('history_list').innerHTML = html;
-                            lastHistoryLen = data.history.length;
-                        }}
-                    }}).catch(e => console.error(e));
-                }}
-                setInterval(update, 2000);
-            </script>
+            <template id="step-tpl">
+                <div class="step-item">
+                    <div class="step-header">
+                        <span class="step-num">STEP <span data-slot="step"></span></span>
+                        <span class="step-status" data-slot="status"><i class="fas"></i> <span data-slot="status-text"></span></span>
+                    </div>
+                    <div class="thought-container" data-slot="thought">
+                        <div class="thought-text" data-slot="thinking"></div>
+                        <a href="#" data-slot="expand">展开全文</a>
+                    </div>
+                    <div class="action-info">
+                        <div style="width: 100%;">
+                            <div style="display:flex; align-items:center; gap:8px; margin-bottom: 4px;">
+                                <span class="action-tag" data-slot="action"></span>
+                                <span data-slot="action-thought" style="color: #10a37f; font-weight: 500; font-size: 13px;"><i class="fas fa-comment-dots"></i> <span data-slot="action-thought-text"></span></span>
+                            </div>
+                            <div style="font-size: 12px; color: #666; margin-left: 2px;">
+                                <span data-slot="text"><i class="fas fa-keyboard"></i> 内容: "<span data-slot="text-value"></span>"</span>
+                                <span data-slot="point" style="margin-left:8px;"><i class="fas fa-mouse-pointer"></i> 坐标: [<span data-slot="point-value"></span>]</span>
+                            </div>
+                            <div class="action-msg" data-slot="message" style="margin-top: 8px; padding: 8px; background: #f0f7ff; border-radius: 6px; color: #0056b3;">
+                                <i class="fas fa-info-circle"></i> <span data-slot="message-text"></span>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </template>
+            <script src="${js_url}" defer></script>
         </body>
         </html>
         """
 
-def run_agent_thread(task, config):
-    state['running'] = True
-    state['history'] = []
-    state['current_task'] = task
-    
-    try:
+# 地址、上限这些导入时就确定的值先填好，请求时只替换配置项
+HTML_SHELL_TEMPLATE = string.Template(string.Template(HTML_SHELL_TEMPLATE).safe_substitute(
+    css_url=APP_CSS_URL,
+    js_url=APP_JS_URL,
+    history_limit=HISTORY_LIMIT,
+    max_steps_limit=MAX_STEPS_LIMIT
+))
+
+class WebUIServer(http.server.ThreadingHTTPServer):
+    # 每个请求一个线程；/events 连接会一直挂着，设为守护线程，退出时不等待它们
+    daemon_threads = True
+    block_on_close = False
+
+# 配置不变时复用同一个 PhoneAgent，模型客户端的连接池在任务之间保持可用
+agent_cache = {"key": None, "agent": None}
+
+# 只有一台手机，同一时间只能运行一个任务
+run_lock = threading.Lock()
+
+def get_agent(config):
+    key = tuple(sorted(config.items()))
+    if agent_cache["key"] != key:
+        # phone_agent 会带入所有设备后端，第一次运行任务时才导入
+        from phone_agent.agent import PhoneAgent, AgentConfig
+        from phone_agent.model import ModelConfig
         model_cfg = ModelConfig(
             api_key=config['api_key'],
             base_url=config['base_url'],
@@ -376,48 +888,95 @@ def run_agent_thread(task, config):
             max_steps=config['max_steps'],
             device_id=config['device_id'] if config['device_id'] else None
         )
-        
-        agent = PhoneAgent(model_config=model_cfg, agent_config=agent_cfg)
-        agent.reset()
+        agent_cache["agent"] = PhoneAgent(model_config=model_cfg, agent_config=agent_cfg)
+        agent_cache["key"] = key
+    agent = agent_cache["agent"]
+    agent.reset()
+    return agent
+
+def run_agent_thread(task, config):
+    if not run_lock.acquire(blocking=False):
+        return
+    try:
+        _run_agent(task, config)
+    finally:
+        run_lock.release()
+
+def _run_agent(task, config):
+    with state_lock:
+        state['running'] = True
+        state['history'].clear()
+        state['current_step'] = 0
+        state['current_task'] = task
+        state['run_id'] += 1
+        notify_state()
+    
+    try:
+        agent = get_agent(config)
         
         # 第一步
         result = agent.step(task)
         _update_step(result)
         
-        while not result.finished and len(state['history']) < agent_cfg.max_steps:
+        while not result.finished and state['current_step'] < agent.agent_config.max_steps:
             result = agent.step()
             _update_step(result)
             
     except Exception as e:
-        state['history'].append({"thinking": f"错误: {str(e)}", "action": None, "message": "已停止", "success": False})
+        add_history({"thinking": f"错误: {str(e)}", "action": None, "message": "已停止", "success": False})
     
-    state['running'] = False
+    with state_lock:
+        state['running'] = False
+        notify_state()
+
+# 通知由单独的线程发送，启动 termux-notification 的开销不再落在 Agent 线程上
+notification_queue = queue.Queue()
+
+def _notification_worker():
+    while True:
+        title, message = notification_queue.get()
+        # 通知使用同一个 id 会互相覆盖，积压时只需要发送最新的一条
+        while True:
+            try:
+                title, message = notification_queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            # 使用 termux-notification 命令
+            subprocess.run([
+                "termux-notification",
+                "--title", title,
+                "--content", message,
+                "--id", "autoglm_notify",
+                "--group", "autoglm"
+            ], capture_output=True)
+        except:
+            pass
+
+threading.Thread(target=_notification_worker, daemon=True).start()
 
 def send_termux_notification(title, message):
-    """通过 Termux:API 发送系统通知"""
-    try:
-        # 使用 termux-notification 命令
-        subprocess.run([
-            "termux-notification",
-            "--title", title,
-            "--content", message,
-            "--id", "autoglm_notify",
-            "--group", "autoglm"
-        ], capture_output=True)
-    except:
-        pass
+    """通过 Termux:API 发送系统通知（放入队列后立即返回）"""
+    notification_queue.put_nowait((title, message))
+
+def add_history(entry):
+    # 步骤编号单独计数，日志被截断后编号仍然连续
+    with state_lock:
+        state['current_step'] += 1
+        entry["step"] = state['current_step']
+        state['history'].append(entry)
+        notify_state()
+    return entry["step"]
 
 def _update_step(result):
     # 保存截图
     if result.screenshot:
         try:
-            img_data = base64.b64decode(result.screenshot)
-            with open("latest_screenshot.png", "wb") as f:
-                f.write(img_data)
+            store_screenshot(result.screenshot_bytes or base64.b64decode(result.screenshot))
         except: pass
     
     # 添加到历史
-    state['history'].append({
+    step_num = add_history({
         "thinking": result.thinking,
         "action": result.action,
         "message": result.message,
@@ -426,7 +985,6 @@ def _update_step(result):
 
     # 发送通知到手机系统
     try:
-        step_num = len(state['history'])
         action_desc = result.action.get('action', '进行中') if result.action else '思考中'
         notif_msg = f"Step {step_num}: {action_desc}\n{result.thinking[:60]}..."
         if result.finished:
@@ -437,8 +995,8 @@ def _update_step(result):
 
 if __name__ == "__main__":
     PORT = 7860
-    socketserver.TCPServer.allow_reuse_address = True
-    httpd = socketserver.TCPServer(("", PORT), SimpleHandler)
+    # 多线程处理请求，慢的截图请求不会阻塞 /state 轮询
+    httpd = WebUIServer(("", PORT), SimpleHandler)
     
     print(f"🚀 全功能 Lite 版已启动!")
     print(f"📱 请访问: http://localhost:{PORT}")